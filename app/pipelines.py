@@ -0,0 +1,388 @@
+"""
+Cached model pipelines shared by the API routes and the precompute job.
+
+Everything expensive goes through ``cache.memoize`` with rounded coordinates,
+so a region warmed up by ``precompute.py`` is served straight from the cache
+when the frontend asks for it later.
+
+The model stack (osmnx, geopandas, sklearn, scipy, shapely) is imported inside
+the functions that need it, so ``/`` and cached requests never pay for it.
+Under gunicorn ``preload_model`` imports it once in the master instead.
+"""
+import json
+import math
+import os
+
+import numpy as np
+
+from app import cache
+from model.raster import combine_densities
+from model.resource import (build_resource_layer, power_data_complete, resource_layer_complete,
+                            resource_score, sample_resource_layer)
+
+# 3 decimals is ~100 m, well below the resolution of the OSM grid and POWER
+COORD_PRECISION = 3
+CACHE_TIMEOUT = 3600
+ROAD_INDEX_DIR = os.environ.get('ROAD_INDEX_DIR', 'road_index')
+
+
+def round_coords(lat, lon):
+    return round(float(lat), COORD_PRECISION), round(float(lon), COORD_PRECISION)
+
+
+def generate_point_grid(lat: float, lon: float, radius_km: float) -> np.ndarray:
+    """
+    Python port of generateDynamicPoints in map.js: same grid, same order,
+    same ``radius_km * 2`` point budget. Returns an (N, 2) array of lat/lon.
+    """
+    radius_km = int(radius_km)
+    num_points = radius_km * 2
+    if num_points == 0:
+        return np.empty((0, 2))
+
+    grid_size = math.ceil(math.sqrt(num_points))
+    step = (2 * radius_km * 1000) / grid_size  # meters per step
+    step_lat = step / 111320
+    step_lon = step / (40075000 * math.cos(math.radians(lat)) / 360)
+
+    half_grid = grid_size // 2
+    offsets = np.arange(-half_grid, half_grid + 1)
+    i, j = np.meshgrid(offsets, offsets, indexing='ij')
+    points = np.column_stack((lat + i.ravel() * step_lat, lon + j.ravel() * step_lon))
+
+    # Same haversine as getDistanceFromLatLonInKm
+    dlat = np.radians(points[:, 0] - lat)
+    dlon = np.radians(points[:, 1] - lon)
+    a = (np.sin(dlat / 2) ** 2 +
+         np.cos(np.radians(lat)) * np.cos(np.radians(points[:, 0])) * np.sin(dlon / 2) ** 2)
+    distances = 6371 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    return points[distances <= radius_km][:num_points]
+
+
+# Cached fetch function; payloads with failed years are not cached
+@cache.memoize(timeout=CACHE_TIMEOUT, response_filter=power_data_complete)
+def fetch_cached_data(lat, lon):
+    from fetch_wind_data import fetch_and_return_wind_data
+    from fetch_solar_data import fetch_and_return_solar_data
+
+    print(f"Fetching fresh data for lat: {lat}, lon: {lon}...")
+    wind_data = fetch_and_return_wind_data(lat, lon)
+    solar_data = fetch_and_return_solar_data(lat, lon)
+    return {"wind_data": wind_data, "solar_data": solar_data}
+
+
+def fetch_point_data(lat, lon):
+    return fetch_cached_data(*round_coords(lat, lon))
+
+
+def run_resource_layer(lat, lon, radius):
+    lat, lon = round_coords(lat, lon)
+    return _run_resource_layer(lat, lon, float(radius))
+
+
+@cache.memoize(timeout=CACHE_TIMEOUT, response_filter=resource_layer_complete)
+def _run_resource_layer(lat, lon, radius):
+    # Lattice nodes go through the point cache, so overlapping areas share them
+    return build_resource_layer((lat, lon), radius, fetch=fetch_cached_data)
+
+
+def invalidate_region(lat, lon, radius):
+    """Drop the OSM-derived cache entries of a region (the POWER ones stay valid)."""
+    lat, lon = round_coords(lat, lon)
+    cache.delete_memoized(_run_complete_model, lat, lon, float(radius))
+    cache.delete_memoized(_run_v3_layers, lat, lon, float(radius))
+
+
+def run_complete_model(lat, lon, radius):
+    lat, lon = round_coords(lat, lon)
+    return _run_complete_model(lat, lon, float(radius))
+
+
+@cache.memoize(timeout=CACHE_TIMEOUT)
+def _run_complete_model(lat, lon, radius):
+    """
+    Returns all the data needed to replicate the Folium layers
+    (Public transport stops, low transit areas, proposed stations,
+     existing charging stations, road heatmap lines).
+    """
+    from shapely.geometry import Point
+    from model.predictive_model import (init, get_area_data, calculate_transit_density,
+                                        identify_low_transit_areas, optimize_locations,
+                                        haversine_distances, node_coords)
+
+    CENTER = (lat, lon)
+    RADIUS = radius
+
+    # 1) Run the pipeline
+    init(lat, lon, radius)
+    networks, existing_stations = get_area_data()
+    grid, density_scores = calculate_transit_density(networks, existing_stations)
+    low_transit_centers = identify_low_transit_areas(grid, density_scores)
+    proposed_locations = optimize_locations(low_transit_centers, existing_stations, networks)
+
+    # 2) Build transport data (bus, rail, subway)
+    #    We'll return these as arrays of lat/lon points.
+    transport_data = {}
+    for mode, network in networks.items():
+        if mode == "drive":
+            continue
+        # Build a list of [lat, lon] for each node
+        nodes = node_coords(network)
+        # Filter out nodes outside the radius (optional)
+        dist = haversine_distances(nodes, np.array([CENTER])).ravel()
+        valid_nodes = nodes[dist <= RADIUS].tolist()
+        transport_data[mode] = valid_nodes
+
+    # 3) Existing stations
+    existing_coords = []
+    if not existing_stations.empty:
+        for _, row in existing_stations.iterrows():
+            if isinstance(row.geometry, Point):
+                coords = (row.geometry.y, row.geometry.x)
+            else:
+                centroid = row.geometry.centroid
+                coords = (centroid.y, centroid.x)
+            # Check distance if you want
+            dist = haversine_distances(np.array([coords]),
+                                       np.array([CENTER]))[0][0]
+            if dist <= RADIUS:
+                existing_coords.append(coords)  # (lat, lon)
+
+    # 4) Build road heatmap lines
+    road_heat_data = []
+    drive_network = networks["drive"]
+    edges = [(u, v, d) for u, v, _, d in drive_network.edges(keys=True, data=True)
+             if d.get('highway') == 'secondary']
+
+    edge_scores = []
+    filtered_edges = []
+    for u, v, _ in edges:
+        u_coords = (drive_network.nodes[u]['y'], drive_network.nodes[u]['x'])
+        v_coords = (drive_network.nodes[v]['y'], drive_network.nodes[v]['x'])
+        mid_point = np.array([(u_coords[0] + v_coords[0]) / 2,
+                              (u_coords[1] + v_coords[1]) / 2])
+        # Check if midpoint is within radius
+        dist = haversine_distances(np.array([mid_point]), np.array([CENTER]))[0][0]
+        if dist <= RADIUS:
+            # sample 10 points along the edge to get a "score"
+            points = np.linspace([u_coords[0], u_coords[1]],
+                                 [v_coords[0], v_coords[1]], num=10)
+            sub_scores = []
+            for point in points:
+                distances = haversine_distances(grid, point.reshape(1, 2))
+                sub_scores.append(density_scores[np.argmin(distances)])
+            edge_avg = np.mean(sub_scores)
+            edge_scores.append(edge_avg)
+            filtered_edges.append((u_coords, v_coords))
+
+    if edge_scores:
+        edge_scores = np.array(edge_scores)
+        norm = (edge_scores - np.min(edge_scores)) / (np.max(edge_scores) - np.min(edge_scores))
+        for i, (u_coords, v_coords) in enumerate(filtered_edges):
+            score = norm[i]
+            # Store the line coordinates + the normalized score
+            road_heat_data.append({
+                "coords": [
+                    [u_coords[0], u_coords[1]],  # lat, lon
+                    [v_coords[0], v_coords[1]]
+                ],
+                "score": float(score)
+            })
+
+    return {
+        "transport_data": transport_data,   # e.g. { "bus": [[lat, lon], ...], "rail": [...], ...}
+        "existing_stations": existing_coords,  # [[lat, lon], ...]
+        "low_transit_centers": low_transit_centers,  # [[lat, lon], ...]
+        "proposed_locations": proposed_locations,     # [[lat, lon], ...]
+        "road_heatmap": road_heat_data,     # [ {coords: [[lat, lon], [lat, lon]], score: 0.XX}, ... ]
+        "center": CENTER,                   # (lat, lon)
+        "radius": RADIUS
+    }
+
+
+def run_v3_layers(lat, lon, radius):
+    lat, lon = round_coords(lat, lon)
+    return _run_v3_layers(lat, lon, float(radius))
+
+
+def _v3_layers_complete(result):
+    return result["resource_missing"] == 0
+
+
+@cache.memoize(timeout=CACHE_TIMEOUT, response_filter=_v3_layers_complete)
+def _run_v3_layers(lat, lon, radius):
+    """
+    Weight-independent part of the v3 model: the per-layer densities on the
+    analysis grid plus, for every secondary road segment, the grid indices of
+    its 10 sample points. Slider changes only re-weight these arrays.
+    """
+    from scipy.spatial import cKDTree
+    from model.predictive_model import (init, get_area_data, calculate_transit_density,
+                                        get_land_use, calculate_density_layers,
+                                        preprocess_road_network, haversine_distances)
+
+    # 1) init + fetch data
+    init(lat, lon, radius)
+    networks, existing_stations = get_area_data()
+    grid, density_scores = calculate_transit_density(networks, existing_stations)
+
+    # 2) land use + resource layer + individual densities
+    land_use = get_land_use()
+    resource_layer = run_resource_layer(lat, lon, radius)
+    layers = calculate_density_layers(
+        grid=grid,
+        land_use=land_use,
+        networks=networks,
+        solar_data=resource_layer,
+        traffic_data=None
+    )
+
+    # 3) sample each secondary road segment, just like create_road_heatmap_v3 does
+    mask = haversine_distances(grid, np.array([[lat, lon]])).ravel() <= radius
+    tree = cKDTree(grid[mask])
+
+    secondary_edges = np.array(preprocess_road_network(networks['drive'])).reshape(-1, 2, 2)
+    points = np.linspace(secondary_edges[:, 0], secondary_edges[:, 1], num=10, axis=1)
+    _, indices = tree.query(points.reshape(-1, 2))
+
+    return {
+        "layers": {name: np.asarray(values)[mask] for name, values in layers.items()},
+        "edges": secondary_edges,
+        "edge_indices": indices.reshape(-1, 10),
+        # POWER nodes filled in from their neighbours; retried on the next request
+        "resource_missing": resource_layer["missing"],
+    }
+
+
+def score_v3_roads(v3_layers, weights):
+    total_density = combine_densities(v3_layers["layers"], weights)
+    if len(v3_layers["edges"]) == 0:
+        return []
+    scores = total_density[v3_layers["edge_indices"]].mean(axis=1)
+    return [
+        {
+            "coords": edge.tolist(),  # [[lat, lon], [lat, lon]]
+            "score": float(score)
+        }
+        for edge, score in zip(v3_layers["edges"], scores)
+    ]
+
+
+def run_suitability_hulls(lat, lon, radius, threshold=None, concave_ratio=None):
+    lat, lon = round_coords(lat, lon)
+    return _run_suitability_hulls(lat, lon, float(radius), threshold, concave_ratio)
+
+
+def _hulls_complete(result):
+    return result["stats"].get("resource_missing", 0) == 0
+
+
+@cache.memoize(timeout=CACHE_TIMEOUT, response_filter=_hulls_complete)
+def _run_suitability_hulls(lat, lon, radius, threshold, concave_ratio):
+    """
+    Server-side version of the map's point grid, totAvg filter and hull layers:
+    score the generateDynamicPoints grid from the cached resource layer, split
+    it at ``threshold`` (default: the mean score, like averageTotAvg) and
+    return one hull per group as GeoJSON plus summary stats.
+    """
+    import shapely
+
+    points = generate_point_grid(lat, lon, radius)
+    if len(points) == 0:
+        return {"hulls": {"above": None, "below": None}, "stats": {"points": 0}}
+
+    resource_layer = run_resource_layer(lat, lon, radius)
+    scores = resource_score(sample_resource_layer(resource_layer, points))
+    if threshold is None:
+        threshold = float(np.mean(scores))
+    above = scores > threshold
+
+    # One multipoint per group (0 = below, 1 = above), hulls in a single batch call
+    order = np.argsort(above, kind='stable')
+    groups = shapely.multipoints(points[order][:, ::-1], indices=above[order].astype(int),
+                                 out=np.empty(2, dtype=object))
+    if concave_ratio is None:
+        hulls = shapely.convex_hull(groups)
+    else:
+        hulls = shapely.concave_hull(groups, ratio=concave_ratio)
+    # Fewer than 3 points (or collinear ones) can't form a polygon
+    is_polygon = shapely.get_type_id(hulls) == shapely.GeometryType.POLYGON
+
+    below_hull, above_hull = (
+        json.loads(shapely.to_geojson(hull)) if ok else None
+        for hull, ok in zip(hulls, is_polygon)
+    )
+    return {
+        "hulls": {"above": above_hull, "below": below_hull},  # GeoJSON, [lon, lat] order
+        "stats": {
+            "points": int(len(points)),
+            "above": int(above.sum()),
+            "below": int((~above).sum()),
+            "threshold": float(threshold),
+            "mean": float(np.mean(scores)),
+            "min": float(np.min(scores)),
+            "max": float(np.max(scores)),
+            "resource_missing": resource_layer["missing"],
+        }
+    }
+
+
+def run_compare_sites(sites):
+    sites = tuple((*round_coords(lat, lon), float(radius)) for lat, lon, radius in sites)
+    return _run_compare_sites(sites)
+
+
+@cache.memoize(timeout=CACHE_TIMEOUT)
+def _run_compare_sites(sites):
+    from model.multi_site import compare_sites
+    return {"sites": compare_sites(list(sites))}
+
+
+def top_roads(weights, k=20, bbox=None, center=None, radius=None):
+    """
+    Best k secondary segments from the precomputed road index, either in a
+    (south, west, north, east) bbox or within radius km of center.
+    """
+    from model.road_index import load_road_index
+
+    index = load_road_index(ROAD_INDEX_DIR)
+    if bbox is not None:
+        idx = index.query_bbox(*bbox)
+    else:
+        idx = index.query_radius(center[0], center[1], radius)
+    return {"roads": index.top_k(idx, weights, k), "candidates": int(len(idx))}
+
+
+def preload_model():
+    """
+    Import the model stack once. Called in the gunicorn master before forking
+    so every worker shares the imported modules instead of loading them itself.
+    """
+    import model.predictive_model  # noqa: F401
+    import model.multi_site  # noqa: F401
+    import fetch_wind_data  # noqa: F401
+    import fetch_solar_data  # noqa: F401
+    import shapely  # noqa: F401
+
+    # The road index is read-only, so workers can share the loaded arrays
+    if os.path.exists(os.path.join(ROAD_INDEX_DIR, 'manifest.json')):
+        from model.road_index import load_road_index
+        load_road_index(ROAD_INDEX_DIR)
+
+    # Convert a census CSV once here, so the workers only memory-map the result
+    from model.population import POPULATION_RASTER, prepare_population_raster
+    if POPULATION_RASTER:
+        prepare_population_raster(POPULATION_RASTER)
+
+
+def warm_up_worker():
+    """
+    Per-worker warm-up after fork: open the read-only datasets whose file
+    handles must not be shared across processes (GDAL/rasterio handles).
+    Memory-mapped data is still shared through the page cache; a census CSV
+    has already been converted by ``preload_model`` in the master.
+    """
+    from model.population import POPULATION_RASTER, open_population_raster
+    if POPULATION_RASTER:
+        open_population_raster(POPULATION_RASTER)
@@ -1,14 +1,10 @@
 from flask import Blueprint, render_template, jsonify, request
-from fetch_wind_data import fetch_and_return_wind_data
-from fetch_solar_data import fetch_and_return_solar_data
-from model.predictive_model import *
-import pandas as pd
-import networkx as nx
-from shapely.geometry import Point
-import numpy as np
 from app import cache  # Import the cache object from __init__.py
-import numpy as np
-from scipy.spatial import cKDTree
+from app.pipelines import (fetch_point_data, run_compare_sites, run_complete_model,
+                           run_suitability_hulls, run_v3_layers, score_v3_roads, top_roads)
+
+MAX_COMPARE_SITES = 100
+MAX_TOP_ROADS = 1000
 
 main = Blueprint('main', __name__)
 
@@ -17,14 +13,6 @@ main = Blueprint('main', __name__)
 def index():
     return render_template('index.html')
 
-# Cached fetch function
-@cache.memoize(timeout=3600)  # Cache results for 1 hour
-def fetch_cached_data(lat, lon):
-    print(f"Fetching fresh data for lat: {lat}, lon: {lon}...")
-    wind_data = fetch_and_return_wind_data(lat, lon)
-    solar_data = fetch_and_return_solar_data(lat, lon)
-    return {"wind_data": wind_data, "solar_data": solar_data}
-
 # Route to fetch wind and solar data for a specific latitude and longitude
 @main.route('/api/wind-solar-data', methods=['GET'])
 def get_wind_solar_data():
@@ -37,7 +25,7 @@ def get_wind_solar_data():
 
     try:
         # Fetch data using the cached function
-        data = fetch_cached_data(latitude, longitude)
+        data = fetch_point_data(latitude, longitude)
         return jsonify(data)
 
     except Exception as e:
@@ -53,103 +41,8 @@ def complete_model_results():
     lat = float(request.args.get("latitude", 50.733334))
     lon = float(request.args.get("longitude", 7.100000))
     radius = float(request.args.get("radius", 25))
-    CENTER = (lat, lon)
-    RADIUS = radius
     try:
-        # 1) Run the pipeline
-        init(lat, lon, radius)
-        networks, existing_stations = get_area_data()
-        grid, density_scores = calculate_transit_density(networks, existing_stations)
-        low_transit_centers = identify_low_transit_areas(grid, density_scores)
-        proposed_locations = optimize_locations(low_transit_centers, existing_stations, networks)
-
-        # 2) Build transport data (bus, rail, subway)
-        #    We'll return these as arrays of lat/lon points.
-        transport_data = {}
-        colors = {'bus': 'green', 'rail': 'red', 'subway': 'orange'}
-        for mode, network in networks.items():
-            if mode == "drive":
-                continue
-            # Build a list of [lat, lon] for each node
-            nodes_df = pd.DataFrame({
-                "lat": nx.get_node_attributes(network, 'y'),
-                "lon": nx.get_node_attributes(network, 'x')
-            })
-            # Filter out nodes outside the radius (optional)
-            valid_nodes = []
-            for _, row in nodes_df.iterrows():
-                dist = haversine_distances(np.array([[row.lat, row.lon]]),
-                                           np.array([CENTER]))[0][0]
-                if dist <= RADIUS:
-                    valid_nodes.append([row.lat, row.lon])
-            transport_data[mode] = valid_nodes
-
-        # 3) Existing stations
-        existing_coords = []
-        if not existing_stations.empty:
-            for _, row in existing_stations.iterrows():
-                if isinstance(row.geometry, Point):
-                    coords = (row.geometry.y, row.geometry.x)
-                else:
-                    centroid = row.geometry.centroid
-                    coords = (centroid.y, centroid.x)
-                # Check distance if you want
-                dist = haversine_distances(np.array([coords]),
-                                           np.array([CENTER]))[0][0]
-                if dist <= RADIUS:
-                    existing_coords.append(coords)  # (lat, lon)
-
-        # 4) Build road heatmap lines
-        road_heat_data = []
-        drive_network = networks["drive"]
-        edges = [(u, v, d) for u, v, _, d in drive_network.edges(keys=True, data=True)
-                 if d.get('highway') == 'secondary']
-
-        edge_scores = []
-        filtered_edges = []
-        for u, v, _ in edges:
-            u_coords = (drive_network.nodes[u]['y'], drive_network.nodes[u]['x'])
-            v_coords = (drive_network.nodes[v]['y'], drive_network.nodes[v]['x'])
-            mid_point = np.array([(u_coords[0] + v_coords[0]) / 2,
-                                  (u_coords[1] + v_coords[1]) / 2])
-            # Check if midpoint is within radius
-            dist = haversine_distances(np.array([mid_point]), np.array([CENTER]))[0][0]
-            if dist <= RADIUS:
-                # sample 10 points along the edge to get a "score"
-                points = np.linspace([u_coords[0], u_coords[1]],
-                                     [v_coords[0], v_coords[1]], num=10)
-                sub_scores = []
-                for point in points:
-                    distances = haversine_distances(grid, point.reshape(1, 2))
-                    sub_scores.append(density_scores[np.argmin(distances)])
-                edge_avg = np.mean(sub_scores)
-                edge_scores.append(edge_avg)
-                filtered_edges.append((u_coords, v_coords))
-
-        if edge_scores:
-            edge_scores = np.array(edge_scores)
-            norm = (edge_scores - np.min(edge_scores)) / (np.max(edge_scores) - np.min(edge_scores))
-            for i, (u_coords, v_coords) in enumerate(filtered_edges):
-                score = norm[i]
-                # Store the line coordinates + the normalized score
-                road_heat_data.append({
-                    "coords": [
-                        [u_coords[0], u_coords[1]],  # lat, lon
-                        [v_coords[0], v_coords[1]]
-                    ],
-                    "score": float(score)
-                })
-
-        # 5) Return JSON
-        return jsonify({
-            "transport_data": transport_data,   # e.g. { "bus": [[lat, lon], ...], "rail": [...], ...}
-            "existing_stations": existing_coords,  # [[lat, lon], ...]
-            "low_transit_centers": low_transit_centers,  # [[lat, lon], ...]
-            "proposed_locations": proposed_locations,     # [[lat, lon], ...]
-            "road_heatmap": road_heat_data,     # [ {coords: [[lat, lon], [lat, lon]], score: 0.XX}, ... ]
-            "center": CENTER,                   # (lat, lon)
-            "radius": RADIUS
-        })
+        return jsonify(run_complete_model(lat, lon, radius))
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -165,62 +58,107 @@ def complete_model_results_v3():
     neighborhood_val = float(request.args.get("neighborhood", 0.25))
     traffic_val = float(request.args.get("traffic", 0.25))
 
+    weights = {
+        'infrastructure': infra_val,
+        'solar': solar_val,
+        'neighborhood': neighborhood_val,
+        'traffic': traffic_val
+    }
+
     try:
-        # 1) init + fetch data
-        init(lat, lon, radius)
-        networks, existing_stations = get_area_data()
-        grid, density_scores = calculate_transit_density(networks, existing_stations)
-
-        # 2) land use + combined density
-        land_use = get_land_use()
-        weights = {
-            'infrastructure': infra_val,
-            'solar': solar_val,
-            'neighborhood': neighborhood_val,
-            'traffic': traffic_val
-        }
-        total_density = calculate_combined_density(
-            grid=grid,
-            land_use=land_use,
-            networks=networks,
-            solar_data=None,
-            traffic_data=None,
-            weights=weights
-        )
-
-        # 3) Build "road_heatmap_v3" data by sampling each secondary road segment
-        #    just like create_road_heatmap_v3 does, but store it in JSON form.
-        mask = haversine_distances(grid, np.array([[lat, lon]])).ravel() <= radius
-        grid_masked = grid[mask]
-        tree = cKDTree(grid_masked)
-
-        secondary_edges = preprocess_road_network(networks['drive'])
-        road_heatmap_v3 = []
-        for u_coords, v_coords in secondary_edges:
-            # sample points along the edge
-            points = np.linspace([u_coords[0], u_coords[1]],
-                                 [v_coords[0], v_coords[1]],
-                                 num=10)
-            _, indices = tree.query(points)
-            score = float(np.mean(total_density[indices]))
-            # We'll store 0..1 in "score"
-            # The front-end can do color = #??
-            road_heatmap_v3.append({
-                "coords": [
-                    [u_coords[0], u_coords[1]],
-                    [v_coords[0], v_coords[1]]
-                ],
-                "score": score
-            })
-
-        # 4) Return as JSON
+        # Layers are cached per area, so slider changes only re-weight them
+        v3_layers = run_v3_layers(lat, lon, radius)
         return jsonify({
-            "road_heatmap_v3": road_heatmap_v3
+            "road_heatmap_v3": score_v3_roads(v3_layers, weights)
         })
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@main.route("/api/suitability-hulls", methods=["GET"])
+def suitability_hulls():
+    """
+    Scores the map's point grid on the server and returns only the hull
+    polygons (GeoJSON) of the points above / below the threshold plus stats.
+    """
+    lat = request.args.get("latitude", type=float)
+    lon = request.args.get("longitude", type=float)
+    radius = request.args.get("radius", 20, type=float)
+    threshold = request.args.get("threshold", type=float)  # default: mean score
+    concave_ratio = request.args.get("concave", type=float)  # 0..1, convex if missing
+
+    if lat is None or lon is None:
+        return jsonify({"error": "Latitude and longitude are required."}), 400
+    if concave_ratio is not None and not 0 <= concave_ratio <= 1:
+        return jsonify({"error": "concave must be between 0 and 1."}), 400
+
+    try:
+        return jsonify(run_suitability_hulls(lat, lon, radius, threshold, concave_ratio))
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@main.route("/api/compare-sites", methods=["POST"])
+def compare_sites():
+    """
+    Ranks many candidate sites in one request. Body:
+    {"sites": [{"latitude": .., "longitude": .., "radius": ..}, ...]}
+    Overlapping sites share one OSM fetch and spatial index.
+    """
+    body = request.get_json(silent=True) or {}
+    try:
+        sites = [(float(site["latitude"]), float(site["longitude"]), float(site.get("radius", 10)))
+                 for site in body.get("sites", [])]
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return jsonify({"error": "Every site needs a numeric latitude and longitude."}), 400
+
+    if not sites:
+        return jsonify({"error": "At least one site is required."}), 400
+    if len(sites) > MAX_COMPARE_SITES:
+        return jsonify({"error": f"At most {MAX_COMPARE_SITES} sites per request."}), 400
+
+    try:
+        return jsonify(run_compare_sites(sites))
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@main.route("/api/top-roads", methods=["GET"])
+def get_top_roads():
+    """
+    Best k secondary road segments from the precomputed road index, for a
+    bbox (south, west, north, east) or a center + radius, with the same
+    weights as the v3 endpoint.
+    """
+    weights = {
+        'infrastructure': request.args.get("infra", 0.25, type=float),
+        'solar': request.args.get("solar", 0.25, type=float),
+        'neighborhood': request.args.get("neighborhood", 0.25, type=float),
+        'traffic': request.args.get("traffic", 0.25, type=float)
+    }
+    k = request.args.get("k", 20, type=int)
+    if not 1 <= k <= MAX_TOP_ROADS:
+        return jsonify({"error": f"k must be between 1 and {MAX_TOP_ROADS}."}), 400
+    bbox = [request.args.get(key, type=float) for key in ("south", "west", "north", "east")]
+    lat = request.args.get("latitude", type=float)
+    lon = request.args.get("longitude", type=float)
+    radius = request.args.get("radius", 20, type=float)
+
+    if None not in bbox:
+        query = {"bbox": bbox}
+    elif lat is not None and lon is not None:
+        query = {"center": (lat, lon), "radius": radius}
+    else:
+        return jsonify({"error": "Either south/west/north/east or latitude/longitude are required."}), 400
+
+    try:
+        return jsonify(top_roads(weights, k, **query))
+
+    except FileNotFoundError:
+        return jsonify({"error": "Road index not built, run build_road_index.py."}), 503
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # Optional route to clear cache (for debugging or testing)
 @main.route('/clear-cache', methods=['GET', 'POST'])
 def clear_cache():
@@ -280,6 +280,7 @@ document.addEventListener('DOMContentLoaded', async function () {
     // ----------------------------------
     let blueHullLayer = null;
     let redHullLayer = null;
+    let hullRequest = null; // AbortController of the pending hull request
 
     // ----------------------------------
     //  4) EVENT LISTENERS
@@ -348,8 +349,8 @@ document.addEventListener('DOMContentLoaded', async function () {
             addFilteredMarkers();
         }
 
-        // Re-draw hull if needed
-        if (hullCheckbox.checked) {
+        // Re-draw hull if needed (updateDynamicPoints already did)
+        if (hullCheckbox.checked && !checkboxInitial.checked) {
             toggleHullPolygons(); // re-run the hull logic
         }
     });
@@ -428,6 +429,11 @@ document.addEventListener('DOMContentLoaded', async function () {
         let radiusKm = parseInt(radiusInput.value) || 20;
         fetchCompleteModelResults(lat, lon, radiusKm);
         // fetchCompleteModelResultsV3(lat, lon, radiusKm);
+
+        // Replace the previous location's hulls
+        if (hullCheckbox.checked) {
+            toggleHullPolygons();
+        }
     }
 
     // ----------------------------------
@@ -592,11 +598,6 @@ document.addEventListener('DOMContentLoaded', async function () {
                             if (checkboxFiltered.checked) {
                                 evaluateAndAddFilteredMarker(pointLat, pointLon, data.totAvg);
                             }
-
-                            // If hull is checked, re-draw hull polygons
-                            if (hullCheckbox.checked) {
-                                toggleHullPolygons();
-                            }
                         })
                         .catch(error => {
                             console.error(
@@ -998,9 +999,15 @@ document.addEventListener('DOMContentLoaded', async function () {
     }
 
     // ----------------------------------
-    // 13) CONVEX HULL LOGIC (BLUE vs. RED)
+    // 13) CONVEX HULL LOGIC (BLUE vs. RED), computed by /api/suitability-hulls
     // ----------------------------------
     function toggleHullPolygons() {
+        // Only the latest request may draw: radius slider ticks fire one each
+        if (hullRequest) {
+            hullRequest.abort();
+            hullRequest = null;
+        }
+
         if (!hullCheckbox.checked) {
             // remove hull layers if present
             if (blueHullLayer) {
@@ -1014,76 +1021,61 @@ document.addEventListener('DOMContentLoaded', async function () {
             return;
         }
 
-        // Gather points for each set
-        const bluePoints = [];
-        const redPoints = [];
+        if (!lastSearchedLat || !lastSearchedLon) return;
 
-        // We'll classify them by "entry.value.normalized == 0 => blue, 1 => red"
-        dynamicMarkers.forEach(marker => {
-            const { lat, lng } = marker.getLatLng();
-            const cacheKey = `${lat.toFixed(5)},${lng.toFixed(5)}`;
-            if (dataCache.has(cacheKey)) {
-                const entry = dataCache.get(cacheKey);
-                if (entry.status === 'fulfilled') {
-                    const val = entry.value.normalized; // Adjust if your data uses a different property
-                    if (val === 0) {
-                        // Blue group
-                        bluePoints.push([lng, lat]); // note [lng, lat] for turf
-                    } else if (val === 1) {
-                        // Red group
-                        redPoints.push([lng, lat]);
-                    }
+        // Scoring, filtering and hulls are done server-side in one request
+        let radiusKm = parseInt(radiusInput.value) || 0;
+        let url = `/api/suitability-hulls?latitude=${lastSearchedLat}&longitude=${lastSearchedLon}&radius=${radiusKm}`;
+        const request = new AbortController();
+        hullRequest = request;
+        fetch(url, { signal: request.signal })
+            .then(resp => resp.json())
+            .then(data => {
+                if (request !== hullRequest) return; // superseded
+                hullRequest = null;
+                if (data.error) {
+                    console.error("Hull error:", data.error);
+                    return;
                 }
-            }
-        });
-
-        // Compute hull for each group
-        const blueHull = computeHull(bluePoints);
-        const redHull = computeHull(redPoints);
-
-        // Remove existing hull layers so we don't stack them up
-        if (blueHullLayer) {
-            map.removeLayer(blueHullLayer);
-            blueHullLayer = null;
-        }
-        if (redHullLayer) {
-            map.removeLayer(redHullLayer);
-            redHullLayer = null;
-        }
+                console.log("Suitability stats:", data.stats);
 
-        // Add them to the map
-        if (blueHull) {
-            blueHullLayer = L.geoJSON(blueHull, {
-                style: {
-                    color: 'blue',
-                    fillColor: 'blue',
-                    fillOpacity: 0.2
+                // Remove existing hull layers so we don't stack them up
+                if (blueHullLayer) {
+                    map.removeLayer(blueHullLayer);
+                    blueHullLayer = null;
+                }
+                if (redHullLayer) {
+                    map.removeLayer(redHullLayer);
+                    redHullLayer = null;
                 }
-            }).addTo(map);
-        }
 
-        if (redHull) {
-            redHullLayer = L.geoJSON(redHull, {
-                style: {
-                    color: 'red',
-                    fillColor: 'red',
-                    fillOpacity: 0.2
+                // The checkbox may have been unticked while we waited
+                if (!hullCheckbox.checked) return;
+
+                // Blue = below threshold, red = above (same as "normalized" 0 / 1)
+                if (data.hulls.below) {
+                    blueHullLayer = L.geoJSON(data.hulls.below, {
+                        style: {
+                            color: 'blue',
+                            fillColor: 'blue',
+                            fillOpacity: 0.2
+                        }
+                    }).addTo(map);
                 }
-            }).addTo(map);
-        }
-    }
 
-    // Helper to do the turf convex
-    function computeHull(coordsArray) {
-        if (!coordsArray || coordsArray.length < 3) {
-            return null; // can't form polygon with < 3 points
-        }
-        // Convert to a FeatureCollection of points
-        const pointsFC = turf.featureCollection(
-            coordsArray.map(c => turf.point(c))
-        );
-        // Let turf compute the convex polygon
-        return turf.convex(pointsFC);
+                if (data.hulls.above) {
+                    redHullLayer = L.geoJSON(data.hulls.above, {
+                        style: {
+                            color: 'red',
+                            fillColor: 'red',
+                            fillOpacity: 0.2
+                        }
+                    }).addTo(map);
+                }
+            })
+            .catch(err => {
+                if (err.name !== 'AbortError') console.error("Hull fetch error:", err);
+            });
     }
 
     function fetchCompleteModelResults(lat, lon, radiusKm) {
@@ -1220,13 +1212,20 @@ document.addEventListener('DOMContentLoaded', async function () {
                 var radiusKm = parseInt(radiusInput.value) || 0;
                 generateDynamicPoints(lastSearchedLat, lastSearchedLon, radiusKm);
             }
+            if (hullCheckbox.checked) {
+                toggleHullPolygons();
+            }
         } else {
             // Remove dynamic & filtered markers
             dynamicMarkers.forEach(m => map.removeLayer(m));
             dynamicMarkers = [];
             removeFilteredMarkers();
 
-            // Remove hull polygons
+            // Remove hull polygons, including a pending request's
+            if (hullRequest) {
+                hullRequest.abort();
+                hullRequest = null;
+            }
             if (blueHullLayer) {
                 map.removeLayer(blueHullLayer);
                 blueHullLayer = null;
@@ -0,0 +1,55 @@
+"""
+Apply OSM change files to the cached road-index tiles and invalidate the
+analysis cache entries over the affected tiles.
+
+    python3 apply_osm_changes.py changes/*.osc.gz
+    python3 build_road_index.py --stale      # rescore the touched tiles
+    python3 precompute.py --centers-file ...  # re-warm the invalidated regions
+
+Change files are applied in the order given. Regions warmed up by
+precompute.py that overlap a touched tile have their model cache entries
+dropped and are marked "stale" in the precompute state file, so the next
+precompute run with the same arguments only recomputes those.
+"""
+import argparse
+import json
+import os
+
+from model.osm_changes import apply_changes, parse_osc, stale_regions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply OSM change files to the cached data.")
+    parser.add_argument("changes", nargs="+", help=".osc or .osc.gz files, oldest first")
+    parser.add_argument("--index-dir", default=os.environ.get("ROAD_INDEX_DIR", "road_index"))
+    parser.add_argument("--state-file", default="precompute_state.jsonl",
+                        help="precompute state file listing the cached regions")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="only update the index, leave the application cache alone")
+    args = parser.parse_args()
+
+    touched = set()
+    for path in args.changes:
+        print(f"Applying {path}")
+        touched |= apply_changes(args.index_dir, parse_osc(path))
+
+    if args.no_cache or not touched or not os.path.exists(args.state_file):
+        return
+
+    from app import create_app
+    from app.pipelines import invalidate_region
+    from precompute import load_states
+
+    regions = [tuple(float(x) for x in key.split(","))
+               for key, status in load_states(args.state_file).items() if status == "ok"]
+    stale = stale_regions(regions, touched)
+
+    with create_app().app_context(), open(args.state_file, "a") as state:
+        for lat, lon, radius in stale:
+            invalidate_region(lat, lon, radius)
+            state.write(json.dumps({"key": f"{lat},{lon},{radius}", "status": "stale"}) + "\n")
+    print(f"Invalidated {len(stale)} cached regions")
+
+
+if __name__ == "__main__":
+    main()
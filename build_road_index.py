@@ -0,0 +1,55 @@
+"""
+Build or refresh the secondary-road score index used by /api/top-roads.
+
+Examples:
+    # whole of Germany (slow: one OSM/POWER fetch per 0.25 degree tile)
+    python3 build_road_index.py --bbox 47.2,5.8,55.1,15.1
+    # resume: only tiles that are not in the index yet
+    python3 build_road_index.py --bbox 47.2,5.8,55.1,15.1 --missing
+    # rebuild tiles marked stale by apply_osm_changes.py
+    python3 build_road_index.py --stale
+    # rebuild specific tiles
+    python3 build_road_index.py --tiles r203_c27,r203_c28
+"""
+import argparse
+import os
+
+from model.road_index import build_tiles, read_manifest, tiles_for_bbox
+
+GERMANY_BBOX = "47.2,5.8,55.1,15.1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the secondary-road score index.")
+    parser.add_argument("--index-dir", default=os.environ.get("ROAD_INDEX_DIR", "road_index"))
+    parser.add_argument("--bbox", metavar="SOUTH,WEST,NORTH,EAST",
+                        help=f"area to cover (Germany: {GERMANY_BBOX})")
+    parser.add_argument("--tiles", help="comma separated tile names to (re)build")
+    parser.add_argument("--missing", action="store_true",
+                        help="with --bbox: skip tiles that are already built")
+    parser.add_argument("--stale", action="store_true",
+                        help="rebuild tiles marked stale, bypassing the osmnx response cache")
+    args = parser.parse_args()
+
+    manifest = read_manifest(args.index_dir)
+    names = []
+    if args.bbox:
+        south, west, north, east = (float(x) for x in args.bbox.split(","))
+        names = tiles_for_bbox(south, west, north, east)
+        if args.missing:
+            names = [name for name in names if name not in manifest["tiles"]]
+    if args.tiles:
+        names += args.tiles.split(",")
+    if args.stale:
+        names += [name for name, tile in manifest["tiles"].items() if tile.get("stale")]
+    if not names:
+        parser.error("nothing to build, use --bbox, --tiles or --stale")
+
+    names = list(dict.fromkeys(names))
+    print(f"Building {len(names)} tiles into {args.index_dir}")
+    # Cached Overpass responses predate the changes that made the tiles stale
+    build_tiles(args.index_dir, names, fresh=args.stale)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
+import os
+
 import requests
 import pandas as pd
 
+POWER_URL = os.environ.get("NASA_POWER_URL", "https://power.larc.nasa.gov/api/temporal/daily/point")
+
 def fetch_and_print_annual_data(latitude, longitude):
     """
     Fetch and print annual GHI and DNI data from NASA POWER for the years 2005 to 2020
@@ -14,7 +18,7 @@ def fetch_and_print_annual_data(latitude, longitude):
         end_date = f"{year}1231"
 
         try:
-            url = "https://power.larc.nasa.gov/api/temporal/daily/point"
+            url = POWER_URL
             parameters = "ALLSKY_SFC_SW_DWN,ALLSKY_SFC_SW_DNI"
             query_params = {
                 "start": start_date,
@@ -63,7 +67,7 @@ def fetch_and_return_solar_data(latitude, longitude):
         end_date = f"{year}1231"
 
         try:
-            url = "https://power.larc.nasa.gov/api/temporal/daily/point"
+            url = POWER_URL
             parameters = "ALLSKY_SFC_SW_DWN,ALLSKY_SFC_SW_DNI"
             query_params = {
                 "start": start_date,
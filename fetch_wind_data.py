@@ -1,6 +1,10 @@
+import os
+
 import requests
 import pandas as pd
 
+POWER_URL = os.environ.get("NASA_POWER_URL", "https://power.larc.nasa.gov/api/temporal/daily/point")
+
 def fetch_and_print_annual_wind_data(latitude, longitude):
     """
     Fetch and print annual wind power density and wind speed data from NASA POWER for the years 2005 to 2020
@@ -16,7 +20,7 @@ def fetch_and_print_annual_wind_data(latitude, longitude):
         end_date = f"{year}1231"
 
         try:
-            url = "https://power.larc.nasa.gov/api/temporal/daily/point"
+            url = POWER_URL
             parameters = "WS10M,WS50M"
             query_params = {
                 "start": start_date,
@@ -77,7 +81,7 @@ def fetch_and_return_wind_data(latitude, longitude):
         end_date = f"{year}1231"
 
         try:
-            url = "https://power.larc.nasa.gov/api/temporal/daily/point"
+            url = POWER_URL
             parameters = "WS10M,WS50M"
             query_params = {
                 "start": start_date,
@@ -0,0 +1,29 @@
+"""
+Gunicorn settings for production:
+
+    gunicorn -c gunicorn.conf.py run:app
+
+The app is preloaded in the master and the model stack is imported there once
+(``when_ready`` runs before the first fork), so workers start from an already
+warm copy-on-write image and a respawned worker is up almost immediately.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+preload_app = True
+# A cold model run for a large radius takes minutes
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 600))
+
+
+def when_ready(server):
+    from app.pipelines import preload_model
+    preload_model()
+    server.log.info("Model stack preloaded in master")
+
+
+def post_fork(server, worker):
+    from app.pipelines import warm_up_worker
+    warm_up_worker()
@@ -0,0 +1,340 @@
+"""
+End-to-end load test against the app under gunicorn, with the Overpass API
+and NASA POWER replaced by local stubs (see loadtest/stubs.py).
+
+    python3 load_test.py --duration 120 --users 8 --mix slider=5,radius=2,burst=3
+    python3 load_test.py --error-rate 0.05 --overpass-latency 3 --flush-redis
+    python3 load_test.py --url http://127.0.0.1:5000   # an app that is already running
+
+Traffic is replayed by virtual users, each picking scenarios by weight:
+
+    slider  drags one v3 weight slider across its range (one request per step)
+    radius  moves the radius slider through --radii on the complete model
+    burst   the wind/solar point grid the map fires when a circle is drawn,
+            generate_point_grid() points, --burst-connections at a time
+
+The report lists throughput, latency percentiles per endpoint, Redis
+keyspace hits/misses over the run, stub traffic, and the peak and final
+RSS of every gunicorn worker (from /proc). ``--report`` also writes it as JSON.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from app.pipelines import generate_point_grid
+from loadtest.stubs import StubConfig, start_stub_server
+
+WEIGHTS = ("infra", "solar", "neighborhood", "traffic")
+
+
+# Scenarios: get(endpoint_label, path, params) sends one timed request
+
+def slider_drag(get, center, args):
+    lat, lon, radius = center
+    moving = random.choice(WEIGHTS)
+    weights = {w: 0.25 for w in WEIGHTS}
+    for value in np.linspace(0, 1, args.slider_steps):
+        weights[moving] = round(float(value), 2)
+        get("v3", "/api/complete-model-results-v3", dict(weights, latitude=lat, longitude=lon, radius=radius))
+
+
+def radius_change(get, center, args):
+    lat, lon, _ = center
+    radii = args.radii if random.random() < 0.5 else args.radii[::-1]
+    for radius in radii:
+        get("complete-model", "/api/complete-model-results", dict(latitude=lat, longitude=lon, radius=radius))
+
+
+def point_burst(get, center, args):
+    lat, lon, radius = center
+    points = generate_point_grid(lat, lon, radius)
+    with ThreadPoolExecutor(args.burst_connections) as pool:
+        list(pool.map(lambda p: get("wind-solar", "/api/wind-solar-data",
+                                    dict(latitude=p[0], longitude=p[1])), points))
+
+
+SCENARIOS = {"slider": slider_drag, "radius": radius_change, "burst": point_burst}
+
+
+class Recorder:
+    def __init__(self, url):
+        self.url = url
+        self.lock = threading.Lock()
+        self.samples = {}  # endpoint label -> [(latency_s, status)]
+        self.local = threading.local()
+
+    def get(self, endpoint, path, params):
+        # one session per thread, bursts run on their own threads
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            status = session.get(self.url + path, params=params, timeout=900).status_code
+        except requests.RequestException:
+            status = 0
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((time.perf_counter() - start, status))
+
+    def summary(self, duration):
+        result = {endpoint: latency_stats(samples, duration)
+                  for endpoint, samples in sorted(self.samples.items())}
+        result["all"] = latency_stats([s for samples in self.samples.values() for s in samples], duration)
+        return result
+
+
+def latency_stats(samples, duration):
+    if not samples:
+        return {"requests": 0}
+    latencies = np.array([s[0] for s in samples]) * 1000
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for _, status in samples if status != 200),
+        "throughput_rps": round(len(samples) / duration, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p90_ms": round(float(np.percentile(latencies, 90)), 1),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 1),
+        "max_ms": round(float(latencies.max()), 1),
+    }
+
+
+def virtual_user(recorder, centers, mix, args, deadline):
+    names, weights = list(mix), list(mix.values())
+    while time.time() < deadline:
+        scenario = SCENARIOS[random.choices(names, weights)[0]]
+        scenario(recorder.get, random.choice(centers), args)
+
+
+# Redis and worker memory
+
+def redis_stats(redis_url):
+    import redis
+    info = redis.Redis.from_url(redis_url).info("stats")
+    return {"hits": info["keyspace_hits"], "misses": info["keyspace_misses"]}
+
+
+def child_pids(pid):
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # the command name may contain spaces, ppid follows the closing paren
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class MemorySampler(threading.Thread):
+    """Samples the RSS of the gunicorn master's workers every interval seconds."""
+
+    def __init__(self, master_pid, interval=1.0):
+        super().__init__(daemon=True)
+        self.master_pid, self.interval = master_pid, interval
+        self.peak, self.last = {}, {}
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.interval)
+
+    def sample(self):
+        for pid in child_pids(self.master_pid):
+            rss = rss_mb(pid)
+            if rss is not None:
+                self.last[pid] = rss
+                self.peak[pid] = max(rss, self.peak.get(pid, 0))
+
+    def stop(self):
+        self.stopped.set()
+        self.sample()
+        return {
+            "master_mb": round(rss_mb(self.master_pid) or 0, 1),
+            "workers": {pid: {"peak_mb": round(self.peak[pid], 1), "final_mb": round(self.last[pid], 1)}
+                        for pid in sorted(self.peak)},
+        }
+
+
+# Setup
+
+def parse_center(value):
+    lat, lon, radius = (float(x) for x in value.split(","))
+    return lat, lon, radius
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, weight = part.split("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}, expected one of {', '.join(SCENARIOS)}")
+        mix[name] = float(weight)
+    return mix
+
+
+def start_gunicorn(args, stub_url, osmnx_cache):
+    env = dict(os.environ,
+               OVERPASS_URL=stub_url + "/api",
+               OSMNX_CACHE_FOLDER=osmnx_cache,
+               NASA_POWER_URL=stub_url + "/api/temporal/daily/point",
+               GUNICORN_BIND=f"127.0.0.1:{args.port}",
+               GUNICORN_WORKERS=str(args.workers),
+               GUNICORN_THREADS=str(args.threads))
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "run:app"],
+                               env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    url = f"http://127.0.0.1:{args.port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            requests.get(url + "/", timeout=2)
+            return process, url
+        except requests.ConnectionError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("gunicorn did not come up within 120 s")
+
+
+def print_report(report):
+    print(f"\n{report['duration_s']:.0f} s, {report['users']} users, mix {report['mix']}")
+    print(f"{'endpoint':16} {'req':>6} {'err':>5} {'req/s':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for endpoint, s in report["latency"].items():
+        if s["requests"]:
+            print(f"{endpoint:16} {s['requests']:6} {s['errors']:5} {s['throughput_rps']:7} "
+                  f"{s['p50_ms']:9} {s['p90_ms']:9} {s['p99_ms']:9} {s['max_ms']:9}")
+    if "redis" in report:
+        r = report["redis"]
+        print(f"\nRedis: {r['hits']} hits, {r['misses']} misses, hit rate {r['hit_rate']}")
+    print("\nStubs:")
+    for service, s in report["stubs"].items():
+        print(f"    {service:9} " + ", ".join(f"{k} {v}" for k, v in s.items()))
+    if "memory" in report:
+        m = report["memory"]
+        print(f"\nMemory: master {m['master_mb']} MB")
+        for pid, w in m["workers"].items():
+            print(f"    worker {pid}: peak {w['peak_mb']} MB, final {w['final_mb']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the app against local API stubs.")
+    parser.add_argument("--url", help="test an already running app instead of starting gunicorn "
+                                      "(it must use the stub URLs itself)")
+    parser.add_argument("--port", type=int, default=5050, help="gunicorn port")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--stub-port", type=int, default=8900)
+    parser.add_argument("--recordings", default="loadtest/recordings")
+    parser.add_argument("--upstream", action="store_true", help="record missing responses from the real APIs")
+    parser.add_argument("--overpass-latency", type=float, default=1.0, help="seconds per Overpass response")
+    parser.add_argument("--power-latency", type=float, default=0.3, help="seconds per POWER response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of stub responses that fail")
+    parser.add_argument("--center", action="append", type=parse_center,
+                        help="LAT,LON,RADIUS_KM (repeatable); users pick one per scenario")
+    parser.add_argument("--radii", default="5,10,15", help="radius slider positions, km")
+    parser.add_argument("--slider-steps", type=int, default=10)
+    parser.add_argument("--burst-connections", type=int, default=6, help="browsers open 6 per host")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("slider=5,radius=2,burst=3"))
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
+    parser.add_argument("--flush-redis", action="store_true", help="start from a cold cache")
+    parser.add_argument("--osmnx-cache", help="osmnx response cache folder for the app "
+                                              "(default: a fresh one per run, so Overpass is really hit)")
+    parser.add_argument("--report", help="write the report as JSON")
+    args = parser.parse_args()
+    args.radii = [float(r) for r in args.radii.split(",")]
+    centers = args.center or [(50.9375, 6.9603, 10.0)]
+    random.seed(args.seed)
+
+    config = StubConfig(args.recordings, args.upstream, args.overpass_latency, args.power_latency,
+                        error_rate=args.error_rate, seed=args.seed)
+    stub = start_stub_server(config, port=args.stub_port)
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+
+    process, sampler = None, None
+    if args.url:
+        url = args.url.rstrip("/")
+    else:
+        osmnx_cache = args.osmnx_cache or tempfile.mkdtemp(prefix="osmnx-cache-")
+        process, url = start_gunicorn(args, stub_url, osmnx_cache)
+        sampler = MemorySampler(process.pid)
+        sampler.start()
+
+    try:
+        redis_before = None
+        try:
+            if args.flush_redis:
+                import redis
+                redis.Redis.from_url(args.redis_url).flushdb()
+            redis_before = redis_stats(args.redis_url)
+        except Exception as e:
+            print(f"Redis stats unavailable: {e}")
+
+        recorder = Recorder(url)
+        start = time.time()
+        deadline = start + args.duration
+        users = [threading.Thread(target=virtual_user, args=(recorder, centers, args.mix, args, deadline))
+                 for _ in range(args.users)]
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        # scenarios finish their current sequence, so the run can overshoot the deadline
+        duration = time.time() - start
+
+        report = {
+            "duration_s": round(duration, 1),
+            "users": args.users,
+            "mix": args.mix,
+            "latency": recorder.summary(duration),
+            "stubs": config.stats,
+        }
+        if redis_before is not None:
+            after = redis_stats(args.redis_url)
+            hits, misses = after["hits"] - redis_before["hits"], after["misses"] - redis_before["misses"]
+            report["redis"] = {"hits": hits, "misses": misses,
+                               "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None}
+        if sampler is not None:
+            report["memory"] = sampler.stop()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=60)
+        stub.shutdown()
+
+    print_report(report)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Local stand-ins for the Overpass API and NASA POWER.
+
+One threaded HTTP server answers both APIs on the paths the app uses
+(``/api/interpreter``, ``/api/status`` and ``/api/temporal/daily/point``), so
+the app is pointed at it with
+
+    OVERPASS_URL=http://127.0.0.1:8900/api
+    NASA_POWER_URL=http://127.0.0.1:8900/api/temporal/daily/point
+
+Responses come from a recordings directory (one JSON file per request, keyed
+by a hash of the query). With ``upstream=True`` a missing recording is fetched
+from the real API once and saved; otherwise a deterministic synthetic
+response is generated: a street/transit lattice for Overpass graph queries,
+scattered tagged nodes for feature queries and smooth daily series for POWER.
+Every response is delayed by the configured latency, and a configurable
+share of requests fails with an HTTP error instead.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import numpy as np
+import requests
+
+OVERPASS_UPSTREAM = "https://overpass-api.de/api/interpreter"
+POWER_UPSTREAM = "https://power.larc.nasa.gov/api/temporal/daily/point"
+
+# Lattice spacing (degrees) and way tags of the synthetic networks
+NETWORKS = {
+    'subway': (0.04, {'railway': 'subway'}),
+    'rail': (0.08, {'railway': 'rail'}),
+    'bus': (0.02, {'highway': 'primary', 'bus': 'yes'}),
+    'drive': (0.01, {'highway': 'residential'}),
+}
+FEATURES_PER_DEG2 = 60
+MIN_FEATURES = 3  # the population KDE needs more than two places
+
+
+class StubConfig:
+    def __init__(self, recordings='loadtest/recordings', upstream=False,
+                 overpass_latency=1.0, power_latency=0.3, jitter=0.5,
+                 error_rate=0.0, error_status=503, seed=0):
+        self.recordings = recordings
+        self.upstream = upstream
+        self.latency = {'overpass': overpass_latency, 'power': power_latency}
+        self.jitter = jitter  # +- fraction of the latency
+        self.error_rate = error_rate
+        # 429/504 make osmnx sleep and retry for minutes, so fail with 503 by default
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {service: {'requests': 0, 'errors': 0, 'recorded': 0, 'synthetic': 0, 'upstream': 0}
+                      for service in ('overpass', 'power')}
+
+    def count(self, service, key):
+        with self.lock:
+            self.stats[service][key] += 1
+
+    def delay(self, service):
+        with self.lock:
+            fail = self.random.random() < self.error_rate
+            factor = 1 + self.jitter * (2 * self.random.random() - 1)
+        time.sleep(max(0.0, self.latency[service] * factor))
+        return fail
+
+
+def _key(text):
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _recording_path(config, service, key):
+    return os.path.join(config.recordings, service, key + '.json')
+
+
+def _load_or_create(config, service, key, upstream, synthetic):
+    path = _recording_path(config, service, key)
+    if os.path.exists(path):
+        config.count(service, 'recorded')
+        with open(path) as f:
+            return f.read()
+    if config.upstream:
+        config.count(service, 'upstream')
+        body = upstream()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            f.write(body)
+        os.replace(path + '.tmp', path)
+        return body
+    config.count(service, 'synthetic')
+    return json.dumps(synthetic())
+
+
+# Overpass
+
+def query_bbox(query):
+    """(south, west, north, east) of all poly:'lat lon ...' filters in a query."""
+    coords = []
+    for poly in re.findall(r"poly:'([^']*)'", query):
+        values = np.array(poly.split(), dtype=float)
+        coords.append(values.reshape(-1, 2))
+    if not coords:
+        return None
+    coords = np.concatenate(coords)
+    return coords[:, 0].min(), coords[:, 1].min(), coords[:, 0].max(), coords[:, 1].max()
+
+
+def network_kind(query):
+    for kind in ('subway', 'rail', 'bus'):
+        if f'"{kind}"' in query or f'~"{kind}' in query:
+            return kind
+    return 'drive'
+
+
+def synthetic_network(query):
+    """A regular lattice of two-node ways covering the query area."""
+    bbox = query_bbox(query)
+    if bbox is None:
+        return {'version': 0.6, 'elements': []}
+    kind = network_kind(query)
+    step, tags = NETWORKS[kind]
+    offset = (list(NETWORKS).index(kind) + 1) * 10 ** 13
+
+    rows = np.arange(np.ceil(bbox[0] / step), np.floor(bbox[2] / step) + 1, dtype=np.int64)
+    cols = np.arange(np.ceil(bbox[1] / step), np.floor(bbox[3] / step) + 1, dtype=np.int64)
+
+    def node_id(r, c):
+        return int(offset + (r + 10 ** 5) * 10 ** 6 + (c + 10 ** 5))
+
+    elements = [{'type': 'node', 'id': node_id(r, c), 'lat': round(r * step, 6), 'lon': round(c * step, 6)}
+                for r in rows for c in cols]
+    for r in rows:
+        for c in cols:
+            for dr, dc in ((0, 1), (1, 0)):
+                if r + dr > rows[-1] or c + dc > cols[-1]:
+                    continue
+                way_tags = dict(tags)
+                # every fourth line of the drive lattice is a secondary road
+                if kind == 'drive' and (r if dc else c) % 4 == 0:
+                    way_tags['highway'] = 'secondary'
+                elements.append({'type': 'way', 'id': node_id(r, c) * 2 + dr,
+                                 'nodes': [node_id(r, c), node_id(r + dr, c + dc)], 'tags': way_tags})
+    return {'version': 0.6, 'elements': elements}
+
+
+def synthetic_features(query):
+    """Tagged nodes scattered over the query area, the same for the same query."""
+    bbox = query_bbox(query)
+    match = re.search(r"\['([^']+)'(?:='([^']+)')?\]", query)
+    if bbox is None or match is None:
+        return {'version': 0.6, 'elements': []}
+    key, value = match.group(1), match.group(2) or 'yes'
+    rng = np.random.default_rng(int(_key(query)[:8], 16))
+    count = int(FEATURES_PER_DEG2 * (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])) + MIN_FEATURES
+    lats = rng.uniform(bbox[0], bbox[2], count)
+    lons = rng.uniform(bbox[1], bbox[3], count)
+    elements = []
+    for i, (lat, lon) in enumerate(zip(lats, lons)):
+        tags = {key: value}
+        if key == 'place':
+            tags.update(name=f'Place {i}', population=str(int(rng.integers(5_000, 500_000))))
+        elements.append({'type': 'node', 'id': 9 * 10 ** 14 + int(_key(query)[:6], 16) * 10 ** 5 + i,
+                         'lat': float(lat), 'lon': float(lon), 'tags': tags})
+    return {'version': 0.6, 'elements': elements}
+
+
+def overpass_response(config, query):
+    def synthetic():
+        # feature queries recurse into members with (._;>;)
+        return synthetic_features(query) if '._;>;' in query else synthetic_network(query)
+
+    def upstream():
+        response = requests.post(OVERPASS_UPSTREAM, data={'data': query}, timeout=300)
+        response.raise_for_status()
+        return response.text
+
+    return _load_or_create(config, 'overpass', _key(query), upstream, synthetic)
+
+
+# NASA POWER
+
+def synthetic_power(params):
+    lat, lon = float(params['latitude']), float(params['longitude'])
+    start = date(int(params['start'][:4]), int(params['start'][4:6]), int(params['start'][6:]))
+    end = date(int(params['end'][:4]), int(params['end'][4:6]), int(params['end'][6:]))
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    season = np.cos(2 * np.pi * np.array([d.timetuple().tm_yday for d in days]) / 365.25)
+    base = {
+        'WS10M': 4.0 + 0.5 * np.sin(np.radians(lon * 7)) + 1.0 * season,
+        'WS50M': 5.5 + 0.7 * np.sin(np.radians(lon * 7)) + 1.3 * season,
+        'ALLSKY_SFC_SW_DWN': 3.5 + 0.04 * (50 - lat) - 2.0 * season,
+        'ALLSKY_SFC_SW_DNI': 3.0 + 0.05 * (50 - lat) - 2.2 * season,
+    }
+    parameter = {}
+    for name in params['parameters'].split(','):
+        values = np.clip(base.get(name, np.zeros(len(days))), 0, None)
+        parameter[name] = {d.strftime('%Y%m%d'): round(float(v), 2) for d, v in zip(days, values)}
+    return {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'properties': {'parameter': parameter}}
+
+
+def power_response(config, params):
+    def upstream():
+        response = requests.get(POWER_UPSTREAM, params=params, timeout=120)
+        response.raise_for_status()
+        return response.text
+
+    key = _key(urlencode(sorted(params.items())))
+    return _load_or_create(config, 'power', key, upstream, lambda: synthetic_power(params))
+
+
+# Server
+
+def make_handler(config):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_text(self, status, body, content_type='application/json'):
+            data = body.encode()
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def handle_service(self, service, respond):
+            config.count(service, 'requests')
+            if config.delay(service):
+                config.count(service, 'errors')
+                self.send_text(config.error_status, json.dumps({'error': 'injected failure'}))
+                return
+            try:
+                self.send_text(200, respond())
+            except Exception as e:
+                self.send_text(502, json.dumps({'error': str(e)}))
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            if url.path == '/api/status':
+                # the format osmnx parses: available slots on the fifth line
+                self.send_text(200, 'Connected as: 0\nCurrent time: -\nAnnounced endpoint: none\n'
+                                    'Rate limit: 0\n2 slots available now.\n', 'text/plain')
+            elif url.path == '/api/temporal/daily/point':
+                self.handle_service('power', lambda: power_response(config, params))
+            elif url.path == '/api/interpreter':
+                self.handle_service('overpass', lambda: overpass_response(config, params.get('data', '')))
+            elif url.path == '/stats':
+                with config.lock:
+                    self.send_text(200, json.dumps(config.stats))
+            else:
+                self.send_text(404, json.dumps({'error': 'not found'}))
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+            if urlparse(self.path).path == '/api/interpreter':
+                self.handle_service('overpass', lambda: overpass_response(config, form.get('data', '')))
+            else:
+                self.send_text(404, json.dumps({'error': 'not found'}))
+
+    return StubHandler
+
+
+def start_stub_server(config, host='127.0.0.1', port=8900):
+    """Serve in a daemon thread; returns the server (``server.shutdown()`` to stop)."""
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the Overpass / NASA POWER stand-ins.")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--recordings", default="loadtest/recordings")
+    parser.add_argument("--upstream", action="store_true", help="record missing responses from the real APIs")
+    parser.add_argument("--overpass-latency", type=float, default=1.0, help="seconds")
+    parser.add_argument("--power-latency", type=float, default=0.3, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = StubConfig(args.recordings, args.upstream, args.overpass_latency, args.power_latency,
+                        error_rate=args.error_rate)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(config))
+    print(f"Stubs on http://127.0.0.1:{args.port}/api")
+    server.serve_forever()
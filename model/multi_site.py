@@ -0,0 +1,218 @@
+"""
+Compare many candidate sites while fetching the OSM data only once.
+
+Sites whose buffered circles overlap are grouped and the union of each
+group's circles is fetched once, so the cost grows with the union area rather
+than with the number of sites. All layers of a group go into one spatial index
+(a cKDTree on unit-sphere coordinates); every site takes its slice from that
+index and runs the usual transit-density model on it. The sites are scored in
+parallel on a fork-based process pool that shares the fetched data copy-on-write.
+"""
+import multiprocessing
+import os
+import threading
+from typing import Dict, List, Tuple
+
+import numpy as np
+import osmnx as ox
+from scipy.spatial import cKDTree
+from shapely import affinity, union_all
+from shapely.geometry import Point
+
+import model.predictive_model as pm
+
+EARTH_RADIUS = 6371
+BUFFER = 1.7  # same edge-correction buffer as get_area_data
+TRANSIT_MODES = list(pm.TRANSIT_FILTERS)
+STATIONS, DRIVE, SECONDARY = 'stations', 'drive', 'secondary'
+# Processes per compare request; every gunicorn worker may fork its own pool
+COMPARE_WORKERS = int(os.environ.get('COMPARE_WORKERS', 4))
+
+# The area a pool worker scores against, set by the pool initializer
+_worker_area = None
+
+
+def to_unit_xyz(points: np.ndarray) -> np.ndarray:
+    lat, lon = np.radians(points[:, 0]), np.radians(points[:, 1])
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def chord(km: float) -> float:
+    """Straight-line distance on the unit sphere for a great-circle distance."""
+    return 2 * np.sin(km / EARTH_RADIUS / 2)
+
+
+def group_sites(sites: List[Tuple[float, float, float]]) -> List[List[int]]:
+    """Indices of sites whose buffered circles overlap, transitively."""
+    parent = list(range(len(sites)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    centers = np.array([site[:2] for site in sites])
+    distances = pm.haversine_distances(centers, centers)
+    for i in range(len(sites)):
+        for j in range(i + 1, len(sites)):
+            if distances[i, j] <= BUFFER * (sites[i][2] + sites[j][2]):
+                parent[find(i)] = find(j)
+
+    groups = {}
+    for i in range(len(sites)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def union_polygon(sites: List[Tuple[float, float, float]]):
+    """Union of the buffered site circles, as lon/lat ellipses."""
+    circles = []
+    for lat, lon, radius in sites:
+        dlat = BUFFER * radius / 111.32
+        dlon = dlat / np.cos(np.radians(lat))
+        circles.append(affinity.scale(Point(lon, lat).buffer(1), dlon, dlat))
+    return union_all(circles)
+
+
+def station_coords(stations) -> np.ndarray:
+    points = [(geom.y, geom.x) if isinstance(geom, Point) else (geom.centroid.y, geom.centroid.x)
+              for geom in stations.geometry] if not stations.empty else []
+    return np.array(points).reshape(-1, 2)
+
+
+def optional_layer(fetch, default=None):
+    """
+    A layer that may legitimately be empty in a small area (no rail, no
+    stations): ``default`` (an empty point array) instead of an osmnx error.
+    """
+    try:
+        return fetch()
+    except ox._errors.ResponseStatusCodeError:
+        raise
+    except ValueError:  # nothing returned, or nothing left inside the polygon
+        return np.empty((0, 2)) if default is None else default
+
+
+def fetch_union_area(polygon) -> Dict:
+    """
+    Fetch every layer once for the (multi)polygon and index it. Transit nodes
+    are kept unthinned here; each site thins its own slice with its own cell size.
+    """
+    drive = ox.graph_from_polygon(polygon, network_type='drive')
+    layers = {mode: optional_layer(lambda: pm.node_coords(ox.graph_from_polygon(polygon, custom_filter=custom_filter)))
+              for mode, custom_filter in pm.TRANSIT_FILTERS.items()}
+    layers[STATIONS] = optional_layer(
+        lambda: station_coords(ox.features_from_polygon(polygon, {'amenity': 'charging_station'})))
+    layers[DRIVE] = pm.node_coords(drive)
+
+    secondary = np.array([((drive.nodes[u]['y'], drive.nodes[u]['x']),
+                           (drive.nodes[v]['y'], drive.nodes[v]['x']))
+                          for u, v, d in drive.edges(data=True)
+                          if d.get('highway') == 'secondary']).reshape(-1, 2, 2)
+    layers[SECONDARY] = secondary.mean(axis=1)  # indexed by midpoint
+
+    names = list(layers)
+    points = np.concatenate([layers[name] for name in names])
+    labels = np.repeat(np.arange(len(names)), [len(layers[name]) for name in names])
+    return {
+        'names': names,
+        'points': points,
+        'labels': labels,
+        'tree': cKDTree(to_unit_xyz(points)),
+        'secondary_edges': secondary,
+        'secondary_offset': sum(len(layers[name]) for name in names[:names.index(SECONDARY)]),
+    }
+
+
+def local_layers(area: Dict, center: Tuple[float, float], radius_km: float) -> Dict[str, np.ndarray]:
+    """Indices of each layer's points within radius_km of center, from the shared index."""
+    idx = np.array(area['tree'].query_ball_point(to_unit_xyz(np.array([center]))[0], chord(radius_km)),
+                   dtype=int)
+    labels = area['labels'][idx]
+    return {name: np.sort(idx[labels == i]) for i, name in enumerate(area['names'])}
+
+
+def score_site(site: Tuple[float, float, float], area: Dict) -> Dict:
+    lat, lon, radius = site
+    pm.init(lat, lon, radius)
+
+    buffered = local_layers(area, (lat, lon), radius * BUFFER)
+    points = area['points']
+    cell_km = pm.thinning_cell_km(radius)
+    networks = {mode: pm.thin_points(points[buffered[mode]], cell_km) for mode in TRANSIT_MODES}
+    stations = points[buffered[STATIONS]]
+
+    grid, density_scores = pm.calculate_transit_density(networks, stations)
+    low_transit_centers = pm.identify_low_transit_areas(grid, density_scores)
+
+    # Proposed locations: nearest drive node, at least 1 km away from existing stations
+    proposed_locations = []
+    drive_nodes = points[buffered[DRIVE]]
+    if low_transit_centers and len(drive_nodes):
+        nearest = drive_nodes[np.argmin(pm.haversine_distances(np.array(low_transit_centers), drive_nodes),
+                                        axis=1)]
+        if len(stations):
+            far = pm.haversine_distances(nearest, stations).min(axis=1) > 1.0
+            nearest = nearest[far]
+        proposed_locations = [tuple(p) for p in nearest]
+
+    # Aggregate road score: mean density along the secondary roads in the circle
+    inner = local_layers(area, (lat, lon), radius)
+    edges = area['secondary_edges'][inner[SECONDARY] - area['secondary_offset']]
+    road_score = None
+    if len(edges):
+        samples = np.linspace(edges[:, 0], edges[:, 1], num=10, axis=1).reshape(-1, 2)
+        _, indices = cKDTree(grid).query(samples)
+        road_score = float(density_scores[indices].reshape(-1, 10).mean())
+
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "radius": radius,
+        "low_transit_clusters": len(low_transit_centers),
+        "low_transit_centers": [tuple(map(float, c)) for c in low_transit_centers],
+        "proposed_locations": [tuple(map(float, p)) for p in proposed_locations],
+        "secondary_roads": int(len(edges)),
+        "road_score": road_score,
+    }
+
+
+def _init_worker(area):
+    global _worker_area
+    _worker_area = area
+
+
+def _score_in_worker(site):
+    return score_site(site, _worker_area)
+
+
+def _can_fork() -> bool:
+    # Forking a process that runs other threads (e.g. a threaded gunicorn
+    # worker) can leave locks held in the child
+    return 'fork' in multiprocessing.get_all_start_methods() and threading.active_count() == 1
+
+
+def compare_sites(sites: List[Tuple[float, float, float]], workers: int = None) -> List[Dict]:
+    """
+    Score every (lat, lon, radius_km) site and return the summaries ranked by
+    aggregate road score, highest first (sites without secondary roads last).
+    Each group is scored on at most ``workers`` (default COMPARE_WORKERS)
+    forked processes; a group of one site is scored in-process.
+    """
+    results = []
+    for group in group_sites(sites):
+        members = [sites[i] for i in group]
+        area = fetch_union_area(union_polygon(members))
+        processes = min(len(members), workers or COMPARE_WORKERS)
+        if processes > 1 and _can_fork():
+            # fork start: the area reaches the workers copy-on-write, not pickled
+            with multiprocessing.get_context('fork').Pool(processes, _init_worker, (area,)) as pool:
+                results.extend(pool.map(_score_in_worker, members))
+        else:
+            results.extend(score_site(site, area) for site in members)
+
+    results.sort(key=lambda r: (r["road_score"] is None, -(r["road_score"] or 0)))
+    for rank, result in enumerate(results, start=1):
+        result["rank"] = rank
+    return results
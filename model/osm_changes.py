@@ -0,0 +1,199 @@
+"""
+Apply OSM change files (.osc / .osc.gz) to the cached road-index tiles.
+
+Cheap changes are applied in place:
+  * moved nodes update the cached transit nodes, charging stations and
+    secondary segment end points,
+  * created / modified / deleted charging stations are upserted / removed,
+  * deleted nodes, deleted secondary ways and ways that are no longer
+    secondary are dropped.
+Changes that need the graph rebuilt (new, upgraded or modified ways of a
+cached layer) only mark their tiles stale. Every touched tile is marked stale in the
+manifest either way, so ``build_road_index.py --stale`` can rescore exactly
+those tiles and the analysis cache entries over them can be dropped.
+"""
+import gzip
+import time
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+
+from model.road_index import (read_manifest, read_tile, tile_bbox, tile_name, tile_of,
+                              write_manifest, write_tile)
+
+TRANSIT_MODES = ['bus', 'rail', 'subway']
+NODE_LAYERS = TRANSIT_MODES + ['stations']
+
+
+def parse_osc(path: str) -> Dict:
+    """
+    Changes of one .osc file, latest action per element wins:
+    {'nodes': {id: (action, lat, lon, tags)}, 'ways': {id: (action, node_refs, tags)}}
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    nodes, ways = {}, {}
+    action = None
+    with opener(path, 'rb') as f:
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                if elem.tag in ('create', 'modify', 'delete'):
+                    action = elem.tag
+                continue
+            if elem.tag == 'node':
+                tags = {t.get('k'): t.get('v') for t in elem.iter('tag')}
+                lat, lon = elem.get('lat'), elem.get('lon')
+                nodes[int(elem.get('id'))] = (action,
+                                              float(lat) if lat is not None else None,
+                                              float(lon) if lon is not None else None,
+                                              tags)
+                elem.clear()
+            elif elem.tag == 'way':
+                tags = {t.get('k'): t.get('v') for t in elem.iter('tag')}
+                refs = [int(nd.get('ref')) for nd in elem.iter('nd')]
+                ways[int(elem.get('id'))] = (action, refs, tags)
+                elem.clear()
+            elif elem.tag == 'relation':
+                elem.clear()
+    return {'nodes': nodes, 'ways': ways}
+
+
+def is_relevant_way(tags: Dict[str, str]) -> bool:
+    """Ways that feed a cached layer: secondary roads and the transit filters."""
+    return (tags.get('highway') == 'secondary'
+            or tags.get('bus') in ('yes', 'designated')
+            or tags.get('railway') in ('rail', 'subway', 'tram'))
+
+
+def _tile_at(lat: float, lon: float) -> str:
+    row, col = tile_of(lat, lon)
+    return tile_name(int(row), int(col))
+
+
+def apply_changes(index_dir: str, changes: Dict, log=print) -> Set[str]:
+    """Apply parsed changes to the index; returns the names of the touched tiles."""
+    manifest = read_manifest(index_dir)
+    nodes, ways = changes['nodes'], changes['ways']
+    changed_ids = np.fromiter(nodes, dtype=np.int64, count=len(nodes))
+
+    # Tiles that need a rebuild because a relevant way was created or modified
+    stale = set()
+    for way_id, (action, refs, tags) in ways.items():
+        if action != 'delete' and is_relevant_way(tags):
+            stale.update(_tile_at(nodes[r][1], nodes[r][2]) for r in refs
+                         if r in nodes and nodes[r][1] is not None)
+
+    # New or moved charging stations, by the tile they end up in
+    # (stations in tiles that aren't built yet are left to the first build)
+    new_stations = {}
+    for node_id, (action, lat, lon, tags) in nodes.items():
+        if action != 'delete' and lat is not None and tags.get('amenity') == 'charging_station':
+            new_stations.setdefault(_tile_at(lat, lon), []).append((node_id, lat, lon))
+
+    # Relevant new / modified ways, located through the nodes a tile already caches
+    # (an upgrade to secondary usually leaves every node where it was)
+    relevant_refs = _refs(ways, lambda action, tags: action != 'delete' and is_relevant_way(tags))
+    # Any changed way over cached transit nodes: it may have lost its transit tags
+    changed_refs = _refs(ways, lambda action, tags: True)
+
+    touched = set()
+    for name in manifest['tiles']:
+        tile = read_tile(index_dir, name)
+        transit_ids = np.concatenate([tile[m + '_ids'] for m in TRANSIT_MODES])
+        known = np.concatenate([tile.get('drive_ids', np.empty(0, np.int64)),
+                                tile['seg_nodes'].ravel(), transit_ids])
+        if _apply_to_tile(tile, nodes, ways, changed_ids, new_stations.get(name, [])):
+            write_tile(index_dir, name, tile)
+            touched.add(name)
+        elif (name in stale or np.isin(relevant_refs, known).any()
+              or np.isin(changed_refs, transit_ids).any()):
+            touched.add(name)
+
+    now = time.strftime('%Y-%m-%dT%H:%M:%S')
+    for name in touched:
+        manifest['tiles'][name].update(stale=True, updated=now)
+    write_manifest(index_dir, manifest)
+    log(f"{len(nodes)} nodes, {len(ways)} ways changed; {len(touched)} tiles marked stale")
+    return touched
+
+
+def _refs(ways: Dict, include) -> np.ndarray:
+    return np.array([r for action, refs, tags in ways.values() if include(action, tags) for r in refs],
+                    dtype=np.int64)
+
+
+def _same_point(coords: np.ndarray, lat: float, lon: float) -> bool:
+    # Compare at the stored precision; a tolerance on degrees would hide real moves
+    return np.array_equal(coords, np.array((lat, lon), dtype=coords.dtype))
+
+
+def _apply_to_tile(tile: Dict[str, np.ndarray], nodes: Dict, ways: Dict, changed_ids: np.ndarray,
+                   new_stations: List[Tuple[int, float, float]]) -> bool:
+    changed = False
+
+    for layer in NODE_LAYERS:
+        ids, coords = tile[layer + '_ids'], tile[layer]
+        hit = np.flatnonzero(np.isin(ids, changed_ids))
+        if not len(hit):
+            continue
+        keep = np.ones(len(ids), dtype=bool)
+        for i in hit:
+            action, lat, lon, _ = nodes[int(ids[i])]
+            # Changed stations are dropped here and re-added to the tile they are in now
+            if action == 'delete' or layer == 'stations':
+                keep[i] = False
+            elif lat is not None and not _same_point(coords[i], lat, lon):
+                coords[i] = (lat, lon)
+                changed = True
+        if not keep.all():
+            tile[layer + '_ids'], tile[layer] = ids[keep], coords[keep]
+            changed = True
+
+    if new_stations:
+        ids = np.array([s[0] for s in new_stations], dtype=np.int64)
+        coords = np.array([s[1:] for s in new_stations], dtype=np.float32)
+        tile['stations_ids'] = np.concatenate([tile['stations_ids'], ids])
+        tile['stations'] = np.concatenate([tile['stations'], coords])
+        changed = True
+
+    # Segments of changed ways: deleted ones and ones that stopped being secondary
+    # go; the ones still secondary stay until the rebuild
+    keep = np.ones(len(tile['seg_way']), dtype=bool)
+    for i in np.flatnonzero(np.isin(tile['seg_way'], np.fromiter(ways, dtype=np.int64, count=len(ways)))):
+        action, _, tags = ways[int(tile['seg_way'][i])]
+        if action == 'delete' or tags.get('highway') != 'secondary':
+            keep[i] = False
+        else:
+            changed = True
+
+    # Segment end points: move or drop with their nodes
+    seg_nodes = tile['seg_nodes']
+    for end in (0, 1):
+        for i in np.flatnonzero(np.isin(seg_nodes[:, end], changed_ids)):
+            action, lat, lon, _ = nodes[int(seg_nodes[i, end])]
+            if action == 'delete':
+                keep[i] = False
+            elif lat is not None and not _same_point(tile['seg_coords'][i, end], lat, lon):
+                tile['seg_coords'][i, end] = (lat, lon)
+                changed = True
+    if not keep.all():
+        for key in ('seg_coords', 'seg_layers', 'seg_nodes', 'seg_way'):
+            tile[key] = tile[key][keep]
+        changed = True
+
+    return changed
+
+
+def stale_regions(regions: Iterable[Tuple[float, float, float]], tiles: Iterable[str],
+                  buffer: float = 1.7) -> List[Tuple[float, float, float]]:
+    """Regions (lat, lon, radius_km) whose buffered circle overlaps one of the tiles."""
+    boxes = np.array([tile_bbox(name) for name in tiles]).reshape(-1, 4)
+    result = []
+    for lat, lon, radius in regions:
+        dlat = buffer * radius / 111.32
+        dlon = dlat / np.cos(np.radians(lat))
+        overlap = ((boxes[:, 0] <= lat + dlat) & (boxes[:, 2] >= lat - dlat) &
+                   (boxes[:, 1] <= lon + dlon) & (boxes[:, 3] >= lon - dlon))
+        if overlap.any():
+            result.append((lat, lon, radius))
+    return result
@@ -0,0 +1,189 @@
+"""
+Population density from a local gridded population dataset.
+
+Point the POPULATION_RASTER environment variable at either
+
+  * a GeoTIFF (read with rasterio, only the window covering the area), or
+  * a census grid CSV with cell-center coordinates and a population column,
+    e.g. the Zensus 2011 1 km grid (x_mitte_1km;y_mitte_1km;Einwohner in
+    EPSG:3035). It is converted once into a .npy raster next to the CSV and
+    memory-mapped afterwards, so only the pages of the area are read.
+
+The raster is resampled to the analysis grid with bilinear interpolation and
+the result is cached per grid.
+"""
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from pyproj import Transformer
+
+from model.raster import bilinear_sample
+
+POPULATION_RASTER = os.environ.get('POPULATION_RASTER')
+CACHE_SIZE = 32
+
+_rasters = {}
+_density_cache = OrderedDict()
+
+
+class PopulationRaster:
+    """
+    North-up raster: ``left``/``top`` are the outer edges of the first pixel,
+    ``dx``/``dy`` the pixel size in units of ``crs``.
+    """
+
+    def __init__(self, crs: str, left: float, top: float, dx: float, dy: float,
+                 shape: tuple, read_window):
+        self.crs = crs
+        self.left = left
+        self.top = top
+        self.dx = dx
+        self.dy = dy
+        self.shape = shape
+        self._read_window = read_window
+        self._transformer = Transformer.from_crs('EPSG:4326', crs, always_xy=True)
+
+    def sample(self, grid: np.ndarray) -> np.ndarray:
+        """Bilinear population values at the (lat, lon) points of ``grid``."""
+        x, y = self._transformer.transform(grid[:, 1], grid[:, 0])
+        # Fractional pixel positions, measured between pixel centers
+        cols = (np.asarray(x) - self.left) / self.dx - 0.5
+        rows = (self.top - np.asarray(y)) / self.dy - 0.5
+
+        row0 = int(np.clip(np.floor(rows.min()), 0, self.shape[0]))
+        row1 = int(np.clip(np.floor(rows.max()) + 2, 0, self.shape[0]))
+        col0 = int(np.clip(np.floor(cols.min()), 0, self.shape[1]))
+        col1 = int(np.clip(np.floor(cols.max()) + 2, 0, self.shape[1]))
+        if row1 <= row0 or col1 <= col0:
+            return np.zeros(len(grid))
+
+        window = self._read_window(row0, row1, col0, col1)
+        window = np.where(np.isfinite(window) & (window > 0), window, 0)
+        return bilinear_sample(window, rows - row0, cols - col0)
+
+
+def open_geotiff(path: str) -> PopulationRaster:
+    try:
+        import rasterio
+        from rasterio.windows import Window
+    except ImportError:
+        raise ImportError("Reading GeoTIFF population rasters needs rasterio (pip install rasterio)")
+
+    dataset = rasterio.open(path)
+    transform = dataset.transform
+    nodata = dataset.nodata
+
+    def read_window(row0, row1, col0, col1):
+        window = dataset.read(1, window=Window(col0, row0, col1 - col0, row1 - row0)).astype(np.float64)
+        if nodata is not None:
+            window[window == nodata] = 0
+        return window
+
+    return PopulationRaster(dataset.crs.to_string(), transform.c, transform.f,
+                            transform.a, -transform.e, dataset.shape, read_window)
+
+
+def convert_census_csv(csv_path: str, npy_path: str, crs: str = 'EPSG:3035',
+                       x_col: Optional[str] = None, y_col: Optional[str] = None,
+                       value_col: Optional[str] = None):
+    """
+    Rasterise a census grid CSV (one row per cell center) into ``npy_path``
+    plus a ``.json`` header. Column names default to the first column
+    starting with x / y and the last column.
+    """
+    df = pd.read_csv(csv_path, sep=None, engine='python')
+    x_col = x_col or next(c for c in df.columns if c.lower().startswith('x'))
+    y_col = y_col or next(c for c in df.columns if c.lower().startswith('y'))
+    value_col = value_col or df.columns[-1]
+
+    x = df[x_col].to_numpy(dtype=np.float64)
+    y = df[y_col].to_numpy(dtype=np.float64)
+    # Zensus marks suppressed cells with -1
+    values = np.clip(pd.to_numeric(df[value_col], errors='coerce').fillna(0).to_numpy(), 0, None)
+
+    cell = np.min(np.diff(np.unique(x))) if len(np.unique(x)) > 1 else 1.0
+    left = x.min() - cell / 2
+    top = y.max() + cell / 2
+    cols = np.rint((x - x.min()) / cell).astype(int)
+    rows = np.rint((y.max() - y) / cell).astype(int)
+
+    raster = np.zeros((rows.max() + 1, cols.max() + 1), dtype=np.float32)
+    raster[rows, cols] = values
+
+    # Other processes may mmap the result while we convert: write per-process
+    # temp files and rename them into place, header first, so a visible .npy
+    # always has its header next to it
+    tmp = f".{os.getpid()}.tmp"
+    header_path = os.path.splitext(npy_path)[0] + '.json'
+    with open(header_path + tmp, 'w') as f:
+        json.dump({'crs': crs, 'left': left, 'top': top, 'dx': cell, 'dy': cell}, f)
+    os.replace(header_path + tmp, header_path)
+    with open(npy_path + tmp, 'wb') as f:
+        np.save(f, raster)
+    os.replace(npy_path + tmp, npy_path)
+
+
+def open_npy(path: str) -> PopulationRaster:
+    with open(os.path.splitext(path)[0] + '.json') as f:
+        header = json.load(f)
+    data = np.load(path, mmap_mode='r')
+
+    def read_window(row0, row1, col0, col1):
+        return np.asarray(data[row0:row1, col0:col1], dtype=np.float64)
+
+    return PopulationRaster(header['crs'], header['left'], header['top'],
+                            header['dx'], header['dy'], data.shape, read_window)
+
+
+def prepare_population_raster(path: str) -> str:
+    """
+    Convert a census CSV into its .npy raster if that is missing or older
+    than the CSV. Returns the path to open; other formats are returned as is.
+    """
+    if os.path.splitext(path)[1].lower() != '.csv':
+        return path
+    npy_path = os.path.splitext(path)[0] + '.npy'
+    if not os.path.exists(npy_path) or os.path.getmtime(npy_path) < os.path.getmtime(path):
+        convert_census_csv(path, npy_path)
+    return npy_path
+
+
+def open_population_raster(path: str) -> PopulationRaster:
+    if path in _rasters:
+        return _rasters[path]
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.tif', '.tiff'):
+        raster = open_geotiff(path)
+    elif ext == '.csv':
+        raster = open_npy(prepare_population_raster(path))
+    elif ext == '.npy':
+        raster = open_npy(path)
+    else:
+        raise ValueError(f"Unsupported population raster format: {path}")
+
+    _rasters[path] = raster
+    return raster
+
+
+def raster_population_density(grid: np.ndarray, path: str = None) -> np.ndarray:
+    """
+    Population on the (lat, lon) points of ``grid``, cached per grid.
+    """
+    path = path or POPULATION_RASTER
+    key = (path, hashlib.sha1(np.ascontiguousarray(grid)).hexdigest())
+    if key in _density_cache:
+        _density_cache.move_to_end(key)
+        return _density_cache[key]
+
+    density = open_population_raster(path).sample(grid)
+
+    _density_cache[key] = density
+    if len(_density_cache) > CACHE_SIZE:
+        _density_cache.popitem(last=False)
+    return density
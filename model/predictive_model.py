@@ -1,22 +1,28 @@
+import os
 import numpy as np
 import pandas as pd
 from sklearn.cluster import DBSCAN
 from geopy.distance import geodesic
 import osmnx as ox
-import folium
 from typing import Tuple, List, Dict
 from shapely.geometry import Point
-import networkx as nx
 from scipy.stats import gaussian_kde
-from branca import colormap as cm
 from sklearn.preprocessing import MinMaxScaler
-from scipy.stats import gaussian_kde
 from sklearn.cluster import MeanShift
 from scipy.spatial import cKDTree
+from model.population import POPULATION_RASTER, raster_population_density
+from model.raster import combine_densities
+from model.resource import resource_score, sample_resource_layer
 
 CENTER = None
 RADIUS = None
 
+# Point osmnx at another Overpass instance (a mirror, or the load-test stub)
+if os.environ.get('OVERPASS_URL'):
+    ox.settings.overpass_url = os.environ['OVERPASS_URL']
+if os.environ.get('OSMNX_CACHE_FOLDER'):
+    ox.settings.cache_folder = os.environ['OSMNX_CACHE_FOLDER']
+
 def init(center_lat: float, center_lon: float, radius_km: float):
     global CENTER, RADIUS
     CENTER = (center_lat, center_lon)
@@ -70,10 +76,7 @@ def calculate_transit_density(networks: Dict, existing_stations: pd.DataFrame) -
 
     for mode, network in networks.items():
         if mode != 'drive':
-            nodes = pd.DataFrame({
-                'lat': nx.get_node_attributes(network, 'y'),
-                'lon': nx.get_node_attributes(network, 'x')
-            }).values
+            nodes = node_coords(network)
 
             if len(nodes) > 0:
                 distances = haversine_distances(grid, nodes)
@@ -160,32 +163,64 @@ def cluster_network_points(networks: Dict) -> Dict:
     clustered_networks = {}
     for mode, network in networks.items():
         if mode != 'drive':
-            points = np.array([(network.nodes[n]['y'], network.nodes[n]['x'])
-                             for n in network.nodes()])
+            points = node_coords(network)
             if len(points) > 0:
                 ms = MeanShift(bandwidth=0.01)  # Adjust bandwidth as needed
                 ms.fit(points)
                 clustered_networks[mode] = ms.cluster_centers_
     return clustered_networks
 
+def node_coords(network) -> np.ndarray:
+    """(lat, lon) array of a graph's nodes; thinned networks already are one."""
+    if isinstance(network, np.ndarray):
+        return network
+    return np.array([(data['y'], data['x']) for _, data in network.nodes(data=True)]).reshape(-1, 2)
+
+def thin_points(points: np.ndarray, cell_km: float) -> np.ndarray:
+    """
+    Deterministic spatial thinning: keep the point closest to the center of
+    each cell of a global ~cell_km grid. Linear time (hash grouping), and the
+    same input always gives the same output, unlike random sampling.
+    """
+    if len(points) == 0:
+        return points
+
+    cell_lat = cell_km / 111.32
+    rows = np.floor(points[:, 0] / cell_lat)
+    # Longitude cells shrink with latitude; use the latitude of the cell row
+    cell_lon = cell_km / (111.32 * np.cos(np.radians((rows + 0.5) * cell_lat)))
+    cols = np.floor(points[:, 1] / cell_lon)
+
+    offset = np.hypot(points[:, 0] / cell_lat - (rows + 0.5),
+                      points[:, 1] / cell_lon - (cols + 0.5))
+    keys = rows.astype(np.int64) * 10_000_000 + cols.astype(np.int64)
+    keep = pd.Series(offset).groupby(keys, sort=False).idxmin().to_numpy()
+    return points[np.sort(keep)]
+
+def thinning_cell_km(radius_km: float) -> float:
+    buffer_radius = radius_km * 1.7
+    n_samples = max(int(10 * radius_km), 1)  # Scale samples with radius
+    # Cell size that keeps about n_samples nodes over the buffered circle
+    return np.sqrt(np.pi * buffer_radius ** 2 / n_samples)
+
+TRANSIT_FILTERS = {
+    'bus': '["bus"~"yes|designated"]',
+    'rail': '["railway"~"rail"]',
+    'subway': '["railway"~"subway|tram"]'
+}
+
 def get_area_data() -> Tuple[Dict, pd.DataFrame]:
     buffer_radius = RADIUS * 1.7
-    n_samples = int(10 * RADIUS)  # Scale samples with radius
+    cell_km = thinning_cell_km(RADIUS)
 
-    networks = {
-        'drive': ox.graph_from_point(CENTER, dist=buffer_radius * 1000, network_type='drive'),
-        'bus': ox.graph_from_point(CENTER, dist=buffer_radius * 1000, custom_filter='["bus"~"yes|designated"]'),
-        'rail': ox.graph_from_point(CENTER, dist=buffer_radius * 1000, custom_filter='["railway"~"rail"]'),
-        'subway': ox.graph_from_point(CENTER, dist=buffer_radius * 1000, custom_filter='["railway"~"subway|tram"]')
-    }
+    networks = {'drive': ox.graph_from_point(CENTER, dist=buffer_radius * 1000, network_type='drive')}
+    for mode, custom_filter in TRANSIT_FILTERS.items():
+        networks[mode] = ox.graph_from_point(CENTER, dist=buffer_radius * 1000, custom_filter=custom_filter)
 
-    # Sample nodes from each network
+    # Thin each transit network to one node per grid cell, as plain (lat, lon) arrays
     for mode, network in networks.items():
         if mode != 'drive':
-            nodes = list(network.nodes())
-            if len(nodes) > n_samples:
-                sampled_nodes = np.random.choice(nodes, n_samples, replace=False)
-                networks[mode] = network.subgraph(sampled_nodes)
+            networks[mode] = thin_points(node_coords(network), cell_km)
 
     charging_stations = ox.features_from_point(
         CENTER,
@@ -276,6 +311,10 @@ def filter_by_radius(grid: np.ndarray, density_scores: np.ndarray) -> Tuple[np.n
    return grid[mask], density_scores[mask]
 
 def calculate_population_density(grid: np.ndarray) -> np.ndarray:
+   # Prefer the local population grid, the OSM city KDE is only a coarse fallback
+   if POPULATION_RASTER:
+       return normalize(raster_population_density(grid))
+
    cities = get_city_data(CENTER, RADIUS * 1.3)
 
    if not cities:
@@ -303,20 +342,25 @@ def get_city_data(center: tuple, radius: float) -> List[Dict]:
                    'location': (row.geometry.y, row.geometry.x),
                    'population': pop
                })
-       except:
+       except (TypeError, ValueError):
            continue
    return cities
 
+def calculate_solar_density(solar_data: Dict, grid: np.ndarray) -> np.ndarray:
+   # solar_data is a resource layer from model.resource.build_resource_layer
+   return normalize(resource_score(sample_resource_layer(solar_data, grid)))
+
+NEIGHBORHOOD_FACTORS = {
+    'green_area': 0.5,
+    'urban_area': -0.6,
+    'water': -0.1,
+    'available_space': 0.8
+}
+
 def calculate_neighborhood_density(grid: np.ndarray, land_use: Dict) -> np.ndarray:
     density = np.zeros(len(grid))
-    factors = {
-        'green_area': 0.5,
-        'urban_area': -0.6,
-        'water': -0.1,
-        'available_space': 0.8
-    }
-
-    for factor, weight in factors.items():
+
+    for factor, weight in NEIGHBORHOOD_FACTORS.items():
         points = land_use[factor][:,[1,0]]  # Swap lat/lon
         if len(points) > 1:
             kde = gaussian_kde(points.T, bw_method='scott')
@@ -353,29 +397,35 @@ def preprocess_road_network(network):
     return secondary_edges
 
 
-def calculate_combined_density(grid: np.ndarray,
+def calculate_density_layers(grid: np.ndarray,
                             networks: Dict,
                             solar_data: np.ndarray,
                             land_use: Dict,
-                            traffic_data: np.ndarray,
-                            weights: Dict) -> np.ndarray:
+                            traffic_data: np.ndarray) -> Dict[str, np.ndarray]:
 
    # Get individual densities
    grid_mask, infra_density = calculate_transit_density(networks, grid)
-   #solar_density = calculate_solar_density(solar_data, grid_mask)
    neighborhood_density = calculate_neighborhood_density(grid_mask, land_use)
    traffic_density = calculate_population_density(grid_mask)
 
    # Convert to numpy arrays
-   infra_density = np.array(infra_density)
-   neighborhood_density = np.array(neighborhood_density)
-   traffic_density = np.array(traffic_density)
+   layers = {
+       'infrastructure': np.array(infra_density),
+       'neighborhood': np.array(neighborhood_density),
+       'traffic': np.array(traffic_density)
+   }
+   if solar_data is not None:
+       layers['solar'] = np.array(calculate_solar_density(solar_data, grid_mask))
+   return layers
 
-   # Combine densities
-   total_density = (weights['infrastructure'] * infra_density +
-                   #weights['solar'] * solar_density +
-                   weights['neighborhood'] * neighborhood_density +
-                   weights['traffic'] * traffic_density
-                   )
+def calculate_combined_density(grid: np.ndarray,
+                            networks: Dict,
+                            solar_data: np.ndarray,
+                            land_use: Dict,
+                            traffic_data: np.ndarray,
+                            weights: Dict) -> np.ndarray:
 
-   return total_density
+   layers = calculate_density_layers(grid, networks, solar_data, land_use, traffic_data)
+
+   # Combine densities
+   return combine_densities(layers, weights)
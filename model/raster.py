@@ -0,0 +1,41 @@
+from typing import Dict
+
+import numpy as np
+
+
+def bilinear_sample(values: np.ndarray, rows: np.ndarray, cols: np.ndarray,
+                    fill: float = 0.0) -> np.ndarray:
+    """
+    Vectorised bilinear interpolation of a 2D array at fractional pixel
+    positions (row/col measured between pixel centers). Positions outside
+    the array get ``fill``; positions on the border are clamped.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n_rows, n_cols = values.shape
+    result = np.full(len(rows), fill, dtype=np.float64)
+
+    inside = (rows > -0.5) & (rows < n_rows - 0.5) & (cols > -0.5) & (cols < n_cols - 0.5)
+    if not inside.any() or values.size == 0:
+        return result
+
+    r = np.clip(rows[inside], 0, n_rows - 1)
+    c = np.clip(cols[inside], 0, n_cols - 1)
+    r0 = np.minimum(np.floor(r).astype(int), max(n_rows - 2, 0))
+    c0 = np.minimum(np.floor(c).astype(int), max(n_cols - 2, 0))
+    r1 = np.minimum(r0 + 1, n_rows - 1)
+    c1 = np.minimum(c0 + 1, n_cols - 1)
+    fr = r - r0
+    fc = c - c0
+
+    top = values[r0, c0] * (1 - fc) + values[r0, c1] * fc
+    bottom = values[r1, c0] * (1 - fc) + values[r1, c1] * fc
+    result[inside] = top * (1 - fr) + bottom * fr
+    return result
+
+
+def combine_densities(layers: Dict[str, np.ndarray], weights: Dict) -> np.ndarray:
+    """Weighted sum of per-point density layers."""
+    total_density = np.zeros(len(next(iter(layers.values()))))
+    for name, density in layers.items():
+        total_density += weights[name] * density
+    return total_density
@@ -0,0 +1,108 @@
+"""
+Solar/wind resource layer over the analysis grid.
+
+NASA POWER data comes on a coarse lattice (0.5° x 0.625° for the MERRA-2
+wind parameters, solar is even coarser), so a whole analysis area is covered
+by a handful of lattice nodes. We fetch only those nodes and interpolate
+GHI/DNI and wind energy onto every grid point in one vectorised pass,
+instead of firing one POWER request per point.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Tuple
+
+import numpy as np
+
+from model.raster import bilinear_sample
+
+POWER_LAT_STEP = 0.5
+POWER_LON_STEP = 0.625
+FETCH_WORKERS = 8
+
+# Same averages the frontend combines into totAvg
+RESOURCE_KEYS = {
+    'wind_10m': ('wind_data', 'avg_10m'),
+    'wind_50m': ('wind_data', 'avg_50m'),
+    'ghi': ('solar_data', 'avg_ghi'),
+    'dni': ('solar_data', 'avg_dni'),
+}
+
+
+def fetch_power_point(lat: float, lon: float) -> Dict:
+    from fetch_wind_data import fetch_and_return_wind_data
+    from fetch_solar_data import fetch_and_return_solar_data
+    return {
+        "wind_data": fetch_and_return_wind_data(lat, lon),
+        "solar_data": fetch_and_return_solar_data(lat, lon)
+    }
+
+
+def power_lattice(south: float, west: float, north: float, east: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Lattice node coordinates enclosing the bbox (at least 2 x 2 nodes)."""
+    lat0 = np.floor(south / POWER_LAT_STEP) * POWER_LAT_STEP
+    lat1 = max(np.ceil(north / POWER_LAT_STEP) * POWER_LAT_STEP, lat0 + POWER_LAT_STEP)
+    lon0 = np.floor(west / POWER_LON_STEP) * POWER_LON_STEP
+    lon1 = max(np.ceil(east / POWER_LON_STEP) * POWER_LON_STEP, lon0 + POWER_LON_STEP)
+    lats = np.round(np.arange(lat0, lat1 + POWER_LAT_STEP / 2, POWER_LAT_STEP), 4)
+    lons = np.round(np.arange(lon0, lon1 + POWER_LON_STEP / 2, POWER_LON_STEP), 4)
+    return lats, lons
+
+
+def build_resource_layer(center: Tuple[float, float], radius_km: float,
+                         fetch: Callable = fetch_power_point) -> Dict:
+    """
+    Fetch the POWER lattice nodes covering the circle and return them as
+    small rasters: {'lats', 'lons', 'wind_10m', 'wind_50m', 'ghi', 'dni'},
+    plus 'missing', the number of nodes that failed and were filled in.
+    ``fetch(lat, lon)`` must return the /api/wind-solar-data payload.
+    """
+    dlat = radius_km / 111.32
+    dlon = radius_km / (111.32 * np.cos(np.radians(center[0])))
+    lats, lons = power_lattice(center[0] - dlat, center[1] - dlon,
+                               center[0] + dlat, center[1] + dlon)
+
+    nodes = [(float(lat), float(lon)) for lat in lats for lon in lons]
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+        results = list(pool.map(lambda node: _fetch_node(fetch, *node), nodes))
+
+    # The fetch functions report failed years in 'data' and average them as 0
+    results = [r if r and power_data_complete(r) else None for r in results]
+    layer = {'lats': lats, 'lons': lons, 'missing': sum(r is None for r in results)}
+    for name, (group, key) in RESOURCE_KEYS.items():
+        values = np.array([r[group][key] if r else np.nan for r in results], dtype=np.float64)
+        # Fill failed nodes with the mean of the others rather than dropping the area
+        if np.isnan(values).all():
+            values[:] = 0
+        values[np.isnan(values)] = np.nanmean(values)
+        layer[name] = values.reshape(len(lats), len(lons))
+    return layer
+
+
+def power_data_complete(payload: Dict) -> bool:
+    """False if any year of the wind or solar series failed to download."""
+    return all('error' not in year
+               for group, _ in RESOURCE_KEYS.values() for year in payload[group]['data'])
+
+
+def resource_layer_complete(layer: Dict) -> bool:
+    return layer['missing'] == 0
+
+
+def _fetch_node(fetch: Callable, lat: float, lon: float):
+    try:
+        return fetch(lat, lon)
+    except Exception as e:
+        print(f"Failed to fetch POWER data for {lat}, {lon}: {e}")
+        return None
+
+
+def sample_resource_layer(layer: Dict, grid: np.ndarray) -> Dict[str, np.ndarray]:
+    """Bilinear resource values at the (lat, lon) points of ``grid``."""
+    rows = (grid[:, 0] - layer['lats'][0]) / POWER_LAT_STEP
+    cols = (grid[:, 1] - layer['lons'][0]) / POWER_LON_STEP
+    return {name: bilinear_sample(layer[name], rows, cols, fill=np.nan)
+            for name in RESOURCE_KEYS}
+
+
+def resource_score(samples: Dict[str, np.ndarray]) -> np.ndarray:
+    """totAvg of the frontend: the plain mean of wind 10m/50m, GHI and DNI."""
+    return (samples['wind_10m'] + samples['wind_50m'] + samples['ghi'] + samples['dni']) / 4
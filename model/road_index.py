@@ -0,0 +1,343 @@
+"""
+Persistent index of scored secondary-road segments.
+
+The index is a directory of tiles (TILE_DEG x TILE_DEG degrees) plus a
+manifest.json. Each tile is one .npz with compact arrays:
+
+    seg_coords   (E, 2, 2) float32  [[lat, lon], [lat, lon]] per segment
+    seg_layers   (E, L)    float32  raw per-layer density along the segment (LAYERS order)
+    seg_nodes    (E, 2)    int64    OSM ids of the segment's end nodes
+    seg_way      (E,)      int64    OSM way id
+    drive_ids    (D,)      int64    OSM ids of the tile's drive-graph nodes
+    <mode>_ids / <mode>    int64 / (N, 2) float32, for every transit mode and 'stations'
+
+A segment belongs to the tile containing its midpoint. Tiles are built and
+rebuilt independently, so a refresh only touches the tiles that changed.
+Layer values are stored on an absolute scale (see raw_layers) and
+normalised to 0..1 over the whole index at load time, so segments from
+different tiles rank against each other fairly. Loading concatenates every
+tile and builds one STRtree over the segment midpoints; bbox / radius top-k
+queries with custom weights then take milliseconds.
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+TILE_DEG = 0.25
+TILE_MARGIN_DEG = 0.02  # fetch a little beyond the tile so boundary segments are complete
+INPUT_MARGIN_DEG = 0.1  # ~10 km of transit / land use / cities around the tile feed its densities
+TILE_GRID = 72  # grid points per side, ~0.0035 deg like the area model's grid
+THIN_CELL_KM = 1.0  # one transit thinning cell size for every tile
+LAYERS = ['infrastructure', 'solar', 'neighborhood', 'traffic']
+MANIFEST = 'manifest.json'
+
+
+def tile_name(row: int, col: int) -> str:
+    return f"r{row}_c{col}"
+
+
+def parse_tile_name(name: str) -> Tuple[int, int]:
+    row, col = name[1:].split('_c')
+    return int(row), int(col)
+
+
+def tile_of(lat, lon):
+    return np.floor(np.asarray(lat) / TILE_DEG).astype(int), np.floor(np.asarray(lon) / TILE_DEG).astype(int)
+
+
+def tile_bbox(name: str) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) of a tile."""
+    row, col = parse_tile_name(name)
+    return row * TILE_DEG, col * TILE_DEG, (row + 1) * TILE_DEG, (col + 1) * TILE_DEG
+
+
+def tiles_for_bbox(south: float, west: float, north: float, east: float) -> List[str]:
+    rows = range(int(np.floor(south / TILE_DEG)), int(np.floor(north / TILE_DEG)) + 1)
+    cols = range(int(np.floor(west / TILE_DEG)), int(np.floor(east / TILE_DEG)) + 1)
+    return [tile_name(r, c) for r in rows for c in cols]
+
+
+def read_manifest(index_dir: str) -> Dict:
+    path = os.path.join(index_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {'tile_deg': TILE_DEG, 'layers': LAYERS, 'tiles': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(index_dir: str, manifest: Dict):
+    path = os.path.join(index_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def read_tile(index_dir: str, name: str) -> Dict[str, np.ndarray]:
+    with np.load(os.path.join(index_dir, name + '.npz')) as data:
+        return dict(data)
+
+
+def write_tile(index_dir: str, name: str, arrays: Dict[str, np.ndarray]):
+    path = os.path.join(index_dir, name + '.npz')
+    np.savez(path + '.tmp.npz', **arrays)
+    os.replace(path + '.tmp.npz', path)
+
+
+def _graph_arrays(graph):
+    ids = np.fromiter(graph.nodes, dtype=np.int64, count=graph.number_of_nodes())
+    coords = np.array([(d['y'], d['x']) for _, d in graph.nodes(data=True)], dtype=np.float32).reshape(-1, 2)
+    return ids, coords
+
+
+def _way_id(osmid) -> int:
+    # simplified edges may merge several ways into a list
+    return int(osmid[0] if isinstance(osmid, list) else osmid)
+
+
+def _empty_points():
+    return np.empty(0, np.int64), np.empty((0, 2), np.float32)
+
+
+def _station_arrays(stations):
+    from model.multi_site import station_coords
+    ids = np.array([osmid for _, osmid in stations.index], dtype=np.int64)
+    return ids, station_coords(stations).astype(np.float32)
+
+
+def tile_grid(name: str) -> np.ndarray:
+    """(lat, lon) analysis grid over the tile, about the spacing of the area model's grid."""
+    south, west, north, east = tile_bbox(name)
+    lat, lon = np.meshgrid(np.linspace(south, north, TILE_GRID), np.linspace(west, east, TILE_GRID))
+    return np.column_stack((lat.ravel(), lon.ravel()))
+
+
+def raw_layers(grid, networks, stations, land_use, cities, resource_layer) -> Dict[str, np.ndarray]:
+    """
+    The v3 density layers on an absolute scale, so tiles can be compared:
+    no edge penalty around the tile center and no per-tile min-max
+    normalisation (RoadIndex normalises over the whole index instead).
+    KDEs are scaled by their point count / population, so they measure
+    how much there is, not just its shape inside the tile.
+    """
+    from scipy.stats import gaussian_kde
+    import model.predictive_model as pm
+    from model.population import POPULATION_RASTER, raster_population_density
+    from model.resource import resource_score, sample_resource_layer
+
+    infrastructure = pm.add_charging_density(grid, pm.calculate_network_density(grid, networks), stations)
+
+    neighborhood = np.zeros(len(grid))
+    for factor, weight in pm.NEIGHBORHOOD_FACTORS.items():
+        points = land_use[factor]
+        if len(points) > 2:
+            points = points[:, [1, 0]]  # (lon, lat) centroids
+            kde = gaussian_kde(points.T, bw_method='scott')
+            neighborhood -= weight * len(points) * kde.evaluate(grid.T)
+
+    if POPULATION_RASTER:
+        traffic = raster_population_density(grid)
+    elif len(cities) > 2:
+        populations = np.array([city['population'] for city in cities], dtype=np.float64)
+        kde = gaussian_kde(np.array([city['location'] for city in cities]).T, weights=populations)
+        traffic = populations.sum() * kde.evaluate(grid.T)
+    else:
+        traffic = np.zeros(len(grid))
+
+    return {
+        'infrastructure': infrastructure,
+        'solar': resource_score(sample_resource_layer(resource_layer, grid)),
+        'neighborhood': neighborhood,
+        'traffic': traffic,
+    }
+
+
+def build_tile(name: str) -> Dict[str, np.ndarray]:
+    """
+    Fetch one tile from OSM/POWER and score its secondary segments with the
+    v3 density layers (per-layer raw values, so weights can be chosen at
+    query time and tiles share one scale).
+    """
+    import osmnx as ox
+    from scipy.spatial import cKDTree
+    import model.predictive_model as pm
+    from model.multi_site import optional_layer
+    from model.resource import build_resource_layer
+
+    south, west, north, east = tile_bbox(name)
+    center = ((south + north) / 2, (west + east) / 2)
+    radius = float(pm.haversine_distances(np.array([center]), np.array([[north, east]]))[0][0])
+    fetch_bbox = (west - TILE_MARGIN_DEG, south - TILE_MARGIN_DEG,
+                  east + TILE_MARGIN_DEG, north + TILE_MARGIN_DEG)
+    # Transit, stations, land use and cities influence the densities well past the tile edge
+    input_bbox = (west - INPUT_MARGIN_DEG, south - INPUT_MARGIN_DEG,
+                  east + INPUT_MARGIN_DEG, north + INPUT_MARGIN_DEG)
+    input_radius = radius + INPUT_MARGIN_DEG * 111.32
+
+    arrays = {}
+    for mode, custom_filter in pm.TRANSIT_FILTERS.items():
+        arrays[mode + '_ids'], arrays[mode] = optional_layer(
+            lambda: _graph_arrays(ox.graph_from_bbox(input_bbox, custom_filter=custom_filter)), _empty_points())
+    arrays['stations_ids'], arrays['stations'] = optional_layer(
+        lambda: _station_arrays(ox.features_from_bbox(input_bbox, {'amenity': 'charging_station'})),
+        _empty_points())
+
+    try:
+        drive = ox.graph_from_bbox(fetch_bbox, network_type='drive')
+        edges = [(u, v, d) for u, v, d in drive.edges(data=True) if d.get('highway') == 'secondary']
+        # lets apply_osm_changes find ways upgraded to secondary whose nodes didn't move
+        arrays['drive_ids'] = np.fromiter(drive.nodes, dtype=np.int64, count=drive.number_of_nodes())
+    except ox._errors.ResponseStatusCodeError:
+        raise
+    except ValueError:  # sea, or no roads at all: an empty tile rather than a failed one
+        edges = []
+        arrays['drive_ids'] = np.empty(0, np.int64)
+
+    # Secondary segments whose midpoint lies in this tile
+    seg_coords = np.array([((drive.nodes[u]['y'], drive.nodes[u]['x']),
+                            (drive.nodes[v]['y'], drive.nodes[v]['x'])) for u, v, _ in edges]).reshape(-1, 2, 2)
+    mid = seg_coords.mean(axis=1)
+    rows, cols = tile_of(mid[:, 0], mid[:, 1])
+    inside = (rows == parse_tile_name(name)[0]) & (cols == parse_tile_name(name)[1])
+    edges = [e for e, keep in zip(edges, inside) if keep]
+    seg_coords = seg_coords[inside]
+
+    seg_layers = np.zeros((len(seg_coords), len(LAYERS)), dtype=np.float32)
+    if len(seg_coords):
+        pm.init(center[0], center[1], input_radius)
+        networks = {mode: pm.thin_points(arrays[mode].astype(np.float64), THIN_CELL_KM)
+                    for mode in pm.TRANSIT_FILTERS}
+        grid = tile_grid(name)
+        layers = raw_layers(grid, networks, arrays['stations'].astype(np.float64),
+                            land_use=pm.get_land_use(),
+                            cities=optional_layer(lambda: pm.get_city_data(center, input_radius), []),
+                            resource_layer=build_resource_layer(center, radius))
+
+        samples = np.linspace(seg_coords[:, 0], seg_coords[:, 1], num=10, axis=1).reshape(-1, 2)
+        _, indices = cKDTree(grid).query(samples)
+        for i, layer in enumerate(LAYERS):
+            seg_layers[:, i] = layers[layer][indices].reshape(-1, 10).mean(axis=1)
+
+    arrays.update({
+        'seg_coords': seg_coords.astype(np.float32),
+        'seg_layers': seg_layers,
+        'seg_nodes': np.array([(u, v) for u, v, _ in edges], dtype=np.int64).reshape(-1, 2),
+        'seg_way': np.array([_way_id(d.get('osmid', -1)) for _, _, d in edges], dtype=np.int64),
+    })
+    return arrays
+
+
+@contextmanager
+def fresh_osm_data():
+    """
+    Bypass the osmnx response cache: after OSM changes it would still serve
+    the Overpass responses from before them.
+    """
+    import osmnx as ox
+
+    use_cache = ox.settings.use_cache
+    ox.settings.use_cache = False
+    try:
+        yield
+    finally:
+        ox.settings.use_cache = use_cache
+
+
+def build_tiles(index_dir: str, names: Iterable[str], log=print, fresh: bool = False) -> Dict:
+    """
+    (Re)build the given tiles and record them in the manifest. ``fresh``
+    fetches from Overpass instead of the osmnx cache (for stale tiles).
+    """
+    if fresh:
+        with fresh_osm_data():
+            return build_tiles(index_dir, names, log)
+
+    os.makedirs(index_dir, exist_ok=True)
+    manifest = read_manifest(index_dir)
+    for name in names:
+        start = time.time()
+        try:
+            arrays = build_tile(name)
+        except Exception as e:
+            log(f"[error] {name}: {e}")
+            continue
+        write_tile(index_dir, name, arrays)
+        manifest['tiles'][name] = {'built': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                                   'segments': int(len(arrays['seg_way'])),
+                                   'stale': False}
+        # Written after every tile so an interrupted build keeps its progress
+        write_manifest(index_dir, manifest)
+        log(f"[ok] {name}: {len(arrays['seg_way'])} segments in {time.time() - start:.1f} s")
+    return manifest
+
+
+class RoadIndex:
+    """All tiles of an index directory as flat arrays plus an STRtree."""
+
+    def __init__(self, index_dir: str):
+        import shapely
+
+        self.index_dir = index_dir
+        self.manifest = read_manifest(index_dir)
+        tiles = [read_tile(index_dir, name) for name in sorted(self.manifest['tiles'])]
+        self.coords = np.concatenate([t['seg_coords'] for t in tiles]) if tiles else np.empty((0, 2, 2), np.float32)
+        layers = np.concatenate([t['seg_layers'] for t in tiles]) if tiles else np.empty((0, len(LAYERS)), np.float32)
+        # Min-max per layer over the whole index, not per tile
+        low, span = (layers.min(axis=0), np.ptp(layers, axis=0)) if len(layers) else (0, 1)
+        self.layers = ((layers - low) / np.where(span > 0, span, 1)).astype(np.float32)
+        self.way = np.concatenate([t['seg_way'] for t in tiles]) if tiles else np.empty(0, np.int64)
+        midpoints = self.coords.mean(axis=1)
+        self.tree = shapely.STRtree(shapely.points(midpoints[:, 1], midpoints[:, 0]))
+
+    def __len__(self):
+        return len(self.way)
+
+    def query_bbox(self, south: float, west: float, north: float, east: float) -> np.ndarray:
+        import shapely
+        return np.sort(self.tree.query(shapely.box(west, south, east, north)))
+
+    def query_radius(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        dlat = radius_km / 111.32
+        dlon = dlat / np.cos(np.radians(lat))
+        idx = self.query_bbox(lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+        mid = np.radians(self.coords[idx].mean(axis=1).astype(np.float64))
+        lat_r, lon_r = np.radians(lat), np.radians(lon)
+        a = (np.sin((mid[:, 0] - lat_r) / 2) ** 2 +
+             np.cos(lat_r) * np.cos(mid[:, 0]) * np.sin((mid[:, 1] - lon_r) / 2) ** 2)
+        return idx[6371 * 2 * np.arcsin(np.sqrt(a)) <= radius_km]
+
+    def top_k(self, idx: np.ndarray, weights: Dict[str, float], k: int = 20) -> List[Dict]:
+        """Best k segments among ``idx`` for a weighted sum of the normalised layers."""
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        w = np.array([weights.get(layer, 0.0) for layer in LAYERS], dtype=np.float32)
+        scores = self.layers[idx] @ w
+        if len(idx) > k:
+            best = np.argpartition(-scores, k)[:k]
+        else:
+            best = np.arange(len(idx))
+        best = best[np.argsort(-scores[best])]
+        return [
+            {
+                "coords": self.coords[i].astype(float).tolist(),  # [[lat, lon], [lat, lon]]
+                "score": float(scores[j]),
+                "layers": dict(zip(LAYERS, self.layers[i].astype(float).tolist())),
+                "way_id": int(self.way[i]),
+            }
+            for i, j in zip(idx[best], best)
+        ]
+
+
+_loaded = {}
+
+
+def load_road_index(index_dir: str) -> RoadIndex:
+    """Load once per process; reloads when the manifest changes on disk."""
+    mtime = os.path.getmtime(os.path.join(index_dir, MANIFEST))
+    cached = _loaded.get(index_dir)
+    if cached is None or cached[0] != mtime:
+        _loaded[index_dir] = (mtime, RoadIndex(index_dir))
+    return _loaded[index_dir][1]
@@ -0,0 +1,194 @@
+"""
+Warm up the application cache for a list of target regions.
+
+Runs the complete-model and v3 pipelines, the wind/solar fetches for the
+map's point grid and the suitability hulls across a process pool, writing everything into the same
+Redis cache the web app reads from.
+
+Examples:
+    python3 precompute.py --center 50.9375,6.9603,20 --center 52.52,13.405,15
+    python3 precompute.py --centers-file cities.csv
+    python3 precompute.py --bbox 50.6,6.8,51.1,7.3 --step 10 --radius 10
+
+Completed regions are appended to the state file, so an interrupted run can
+be restarted with the same arguments and only does the remaining work.
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+_app_context = None
+
+
+def parse_center(value):
+    lat, lon, radius = (float(x) for x in value.split(","))
+    return lat, lon, radius
+
+
+def bbox_centers(south, west, north, east, step_km, radius_km):
+    """
+    Centers of a regular grid with ``step_km`` spacing covering the bbox.
+    """
+    mid_lat = (south + north) / 2
+    step_lat = step_km / 111.32
+    step_lon = step_km / (111.32 * np.cos(np.radians(mid_lat)))
+    lats = np.arange(south, north + step_lat / 2, step_lat)
+    lons = np.arange(west, east + step_lon / 2, step_lon)
+    return [(float(lat), float(lon), radius_km) for lat in lats for lon in lons]
+
+
+def load_jobs(args):
+    jobs = [parse_center(c) for c in args.center or []]
+
+    if args.centers_file:
+        with open(args.centers_file, newline="") as f:
+            for row in csv.DictReader(f):
+                jobs.append((float(row["latitude"]), float(row["longitude"]),
+                             float(row.get("radius") or args.radius)))
+
+    if args.bbox:
+        south, west, north, east = (float(x) for x in args.bbox.split(","))
+        jobs.extend(bbox_centers(south, west, north, east, args.step, args.radius))
+
+    return jobs
+
+
+def job_key(job):
+    from app.pipelines import round_coords
+    lat, lon = round_coords(job[0], job[1])
+    return f"{lat},{lon},{float(job[2])}"
+
+
+def load_states(state_file):
+    """Latest status per region key (later lines, e.g. "stale", win)."""
+    states = {}
+    if not os.path.exists(state_file):
+        return states
+    with open(state_file) as f:
+        for line in f:
+            entry = json.loads(line)
+            states[entry["key"]] = entry["status"]
+    return states
+
+
+def load_done(state_file):
+    return {key for key, status in load_states(state_file).items() if status == "ok"}
+
+
+def init_worker(cache_timeout):
+    global _app_context
+    from app import create_app
+    from app import pipelines
+
+    app = create_app()
+    _app_context = app.app_context()
+    _app_context.push()
+
+    # Precomputed entries usually need to outlive the default 1 hour
+    for fn in (pipelines.fetch_cached_data, pipelines._run_resource_layer,
+               pipelines._run_complete_model, pipelines._run_v3_layers,
+               pipelines._run_suitability_hulls):
+        fn.cache_timeout = cache_timeout
+
+
+def run_job(job, steps, fresh=False):
+    if fresh:
+        # A stale region was invalidated by OSM changes, which the osmnx cache predates
+        from model.road_index import fresh_osm_data
+        with fresh_osm_data():
+            return run_job(job, steps)
+
+    from app.pipelines import (fetch_point_data, generate_point_grid, run_complete_model,
+                               run_suitability_hulls, run_v3_layers)
+
+    lat, lon, radius = job
+    start = time.time()
+    if "model" in steps:
+        run_complete_model(lat, lon, radius)
+    if "v3" in steps:
+        run_v3_layers(lat, lon, radius)
+    if "points" in steps:
+        for point_lat, point_lon in generate_point_grid(lat, lon, radius):
+            fetch_point_data(point_lat, point_lon)
+    if "hulls" in steps:
+        run_suitability_hulls(lat, lon, radius)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute cached results for target regions.")
+    parser.add_argument("--center", action="append", metavar="LAT,LON,RADIUS",
+                        help="region center and radius in km (repeatable)")
+    parser.add_argument("--centers-file", help="CSV with latitude,longitude[,radius] columns")
+    parser.add_argument("--bbox", metavar="SOUTH,WEST,NORTH,EAST",
+                        help="cover a bounding box with a grid of regions")
+    parser.add_argument("--step", type=float, default=10.0, help="bbox grid spacing in km")
+    parser.add_argument("--radius", type=float, default=20.0, help="default radius in km")
+    parser.add_argument("--steps", default="model,v3,points,hulls",
+                        help="comma separated subset of model,v3,points,hulls")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--rate", type=float, default=6.0,
+                        help="maximum regions started per minute (0 = unlimited)")
+    parser.add_argument("--cache-timeout", type=int, default=7 * 24 * 3600,
+                        help="cache timeout of the precomputed entries in seconds")
+    parser.add_argument("--state-file", default="precompute_state.jsonl",
+                        help="progress log used to resume interrupted runs")
+    args = parser.parse_args()
+
+    steps = set(args.steps.split(","))
+    jobs = load_jobs(args)
+    if not jobs:
+        parser.error("no regions given, use --center, --centers-file or --bbox")
+
+    done = load_done(args.state_file)
+    pending = [job for job in jobs if job_key(job) not in done]
+    stale = {key for key, status in load_states(args.state_file).items() if status == "stale"}
+    print(f"{len(jobs)} regions, {len(jobs) - len(pending)} already done, {len(pending)} to go")
+
+    min_interval = 60.0 / args.rate if args.rate > 0 else 0.0
+    failed = 0
+    with open(args.state_file, "a") as state, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                initargs=(args.cache_timeout,)) as pool:
+        futures = {}
+
+        def drain(timeout):
+            # Record finished regions right away so an interrupted run can resume
+            nonlocal failed
+            finished, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in finished:
+                job = futures.pop(future)
+                entry = {"key": job_key(job)}
+                try:
+                    entry.update(status="ok", seconds=round(future.result(), 1))
+                except Exception as e:
+                    failed += 1
+                    entry.update(status="error", error=str(e))
+                state.write(json.dumps(entry) + "\n")
+                state.flush()
+                print(f"[{entry['status']}] {entry['key']} {entry.get('seconds', entry.get('error'))}")
+
+        next_submit = time.time()
+        for job in pending:
+            # Throttle region starts so we stay polite towards Overpass and POWER
+            while time.time() < next_submit:
+                if futures:
+                    drain(max(0.0, next_submit - time.time()))
+                else:
+                    time.sleep(max(0.0, next_submit - time.time()))
+            futures[pool.submit(run_job, job, steps, job_key(job) in stale)] = job
+            next_submit = time.time() + min_interval
+
+        while futures:
+            drain(None)
+
+    print(f"Finished: {len(pending) - failed} ok, {failed} failed")
+
+
+if __name__ == "__main__":
+    main()
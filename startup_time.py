@@ -0,0 +1,36 @@
+"""
+Measure import-time cost of the web app and of the model stack.
+
+    python3 startup_time.py
+
+Each measurement runs in a fresh interpreter, so nothing is cached between them.
+"""
+import subprocess
+import sys
+
+STEPS = {
+    "create_app()": "from app import create_app; create_app()",
+    "model stack": "from app.pipelines import preload_model; preload_model()",
+}
+
+
+def measure(code):
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                         capture_output=True, text=True, check=True).stderr
+    # lines look like "import time: self [us] | cumulative | imported package"
+    modules = []
+    for line in out.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((int(cumulative), name.rstrip()))
+    top_level = [m for m in modules if not m[1].startswith("  ")]
+    return sum(c for c, _ in top_level) / 1e6, sorted(top_level, reverse=True)[:8]
+
+
+if __name__ == "__main__":
+    for label, code in STEPS.items():
+        total, top = measure(code)
+        print(f"{label}: {total:.2f} s")
+        for cumulative, name in top:
+            print(f"    {cumulative / 1e6:6.3f} s  {name.strip()}")
@@ -0,0 +1,140 @@
+import gzip
+
+import numpy as np
+import pytest
+
+from model.osm_changes import apply_changes, parse_osc, stale_regions
+from model.road_index import read_manifest, read_tile, write_manifest, write_tile
+
+# Tile r203_c27 covers 50.75..51.0 N, 6.75..7.0 E; r203_c28 is east of it
+TILE, EAST_TILE = 'r203_c27', 'r203_c28'
+
+
+def empty_points():
+    return np.empty(0, np.int64), np.empty((0, 2), np.float32)
+
+
+def make_tile(**overrides):
+    tile = {
+        'bus_ids': np.array([1, 2], np.int64),
+        'bus': np.array([[50.80, 6.80], [50.81, 6.81]], np.float32),
+        'rail_ids': np.array([3], np.int64),
+        'rail': np.array([[50.82, 6.82]], np.float32),
+        'subway_ids': empty_points()[0], 'subway': empty_points()[1],
+        'stations_ids': np.array([9], np.int64),
+        'stations': np.array([[50.90, 6.90]], np.float32),
+        # way 100: nodes 10-11-12, way 200: nodes 20-21
+        'seg_coords': np.array([[[50.85, 6.85], [50.86, 6.86]],
+                                [[50.86, 6.86], [50.87, 6.87]],
+                                [[50.95, 6.95], [50.96, 6.96]]], np.float32),
+        'seg_layers': np.array([[0.1, 0.2, 0.3, 0.4]] * 3, np.float32),
+        'seg_nodes': np.array([[10, 11], [11, 12], [20, 21]], np.int64),
+        'seg_way': np.array([100, 100, 200], np.int64),
+        'drive_ids': np.array([10, 11, 12, 20, 21, 30, 31], np.int64),
+    }
+    tile.update(overrides)
+    return tile
+
+
+@pytest.fixture
+def index_dir(tmp_path):
+    write_tile(str(tmp_path), TILE, make_tile())
+    empty = {key: value[:0] for key, value in make_tile().items()}
+    write_tile(str(tmp_path), EAST_TILE, empty)
+    write_manifest(str(tmp_path), {'tiles': {TILE: {'stale': False}, EAST_TILE: {'stale': False}}})
+    return str(tmp_path)
+
+
+def apply_osc(index_dir, tmp_path, body, name='change.osc'):
+    path = tmp_path / name
+    xml = f'<?xml version="1.0" encoding="UTF-8"?>\n<osmChange version="0.6">{body}</osmChange>'
+    if name.endswith('.gz'):
+        with gzip.open(path, 'wt') as f:
+            f.write(xml)
+    else:
+        path.write_text(xml)
+    return apply_changes(index_dir, parse_osc(str(path)), log=lambda *args: None)
+
+
+def test_parse_osc_gz_keeps_last_action(tmp_path):
+    path = tmp_path / 'change.osc.gz'
+    with gzip.open(path, 'wt') as f:
+        f.write('<osmChange><create><node id="5" lat="1.5" lon="2.5"><tag k="amenity" v="x"/></node></create>'
+                '<delete><node id="5"/></delete>'
+                '<modify><way id="7"><nd ref="5"/><nd ref="6"/><tag k="highway" v="secondary"/></way></modify>'
+                '</osmChange>')
+    changes = parse_osc(str(path))
+    assert changes['nodes'] == {5: ('delete', None, None, {})}
+    assert changes['ways'] == {7: ('modify', [5, 6], {'highway': 'secondary'})}
+
+
+def test_small_move_of_transit_node_is_applied(index_dir, tmp_path):
+    # ~33 m north
+    touched = apply_osc(index_dir, tmp_path, '<modify><node id="1" lat="50.8003" lon="6.8"/></modify>')
+    assert touched == {TILE}
+    assert read_tile(index_dir, TILE)['bus'][0].tolist() == pytest.approx([50.8003, 6.8])
+    assert read_manifest(index_dir)['tiles'][TILE]['stale']
+
+
+def test_tag_only_change_touches_nothing(index_dir, tmp_path):
+    body = '<modify><node id="1" lat="50.8" lon="6.8"><tag k="name" v="Stop"/></node></modify>'
+    assert apply_osc(index_dir, tmp_path, body) == set()
+    assert not read_manifest(index_dir)['tiles'][TILE]['stale']
+
+
+def test_moved_segment_node_updates_both_segments(index_dir, tmp_path):
+    touched = apply_osc(index_dir, tmp_path, '<modify><node id="11" lat="50.8605" lon="6.8605"/></modify>')
+    tile = read_tile(index_dir, TILE)
+    assert touched == {TILE}
+    assert tile['seg_coords'][0, 1].tolist() == pytest.approx([50.8605, 6.8605])
+    assert tile['seg_coords'][1, 0].tolist() == pytest.approx([50.8605, 6.8605])
+
+
+def test_deleted_node_and_way_drop_segments(index_dir, tmp_path):
+    touched = apply_osc(index_dir, tmp_path, '<delete><node id="3"/><way id="200"/></delete>')
+    tile = read_tile(index_dir, TILE)
+    assert touched == {TILE}
+    assert len(tile['rail_ids']) == 0
+    assert tile['seg_way'].tolist() == [100, 100]
+
+
+def test_downgraded_way_is_dropped(index_dir, tmp_path):
+    body = ('<modify><way id="100"><nd ref="10"/><nd ref="11"/><nd ref="12"/>'
+            '<tag k="highway" v="tertiary"/></way></modify>')
+    touched = apply_osc(index_dir, tmp_path, body)
+    assert touched == {TILE}
+    assert read_tile(index_dir, TILE)['seg_way'].tolist() == [200]
+
+
+def test_modified_secondary_way_marks_stale_and_keeps_segments(index_dir, tmp_path):
+    body = ('<modify><way id="100"><nd ref="10"/><nd ref="11"/><nd ref="12"/><nd ref="13"/>'
+            '<tag k="highway" v="secondary"/></way></modify>')
+    assert apply_osc(index_dir, tmp_path, body) == {TILE}
+    assert read_tile(index_dir, TILE)['seg_way'].tolist() == [100, 100, 200]
+
+
+def test_upgrade_to_secondary_without_moved_nodes(index_dir, tmp_path):
+    body = '<modify><way id="300"><nd ref="30"/><nd ref="31"/><tag k="highway" v="secondary"/></way></modify>'
+    assert apply_osc(index_dir, tmp_path, body) == {TILE}
+    assert read_manifest(index_dir)['tiles'][TILE]['stale']
+    assert not read_manifest(index_dir)['tiles'][EAST_TILE]['stale']
+
+
+def test_transit_way_losing_its_tags(index_dir, tmp_path):
+    body = '<modify><way id="400"><nd ref="1"/><nd ref="2"/><tag k="highway" v="service"/></way></modify>'
+    assert apply_osc(index_dir, tmp_path, body) == {TILE}
+
+
+def test_station_moved_to_neighbouring_tile(index_dir, tmp_path):
+    body = ('<modify><node id="9" lat="50.9" lon="7.1"><tag k="amenity" v="charging_station"/></node></modify>'
+            '<create><node id="8" lat="50.91" lon="6.91"><tag k="amenity" v="charging_station"/></node></create>')
+    touched = apply_osc(index_dir, tmp_path, body, name='change.osc.gz')
+    assert touched == {TILE, EAST_TILE}
+    assert read_tile(index_dir, TILE)['stations_ids'].tolist() == [8]
+    assert read_tile(index_dir, EAST_TILE)['stations_ids'].tolist() == [9]
+
+
+def test_stale_regions():
+    regions = [(50.9, 6.9, 5.0), (50.9, 7.2, 2.0), (10.0, 10.0, 5.0)]
+    assert stale_regions(regions, [TILE]) == [(50.9, 6.9, 5.0)]
+    assert stale_regions(regions, []) == []
@@ -0,0 +1,69 @@
+import sys
+
+import numpy as np
+import osmnx as ox
+import pytest
+
+import build_road_index
+from loadtest.stubs import StubConfig, start_stub_server
+from model import road_index
+from model.road_index import read_manifest, tile_bbox, write_manifest
+
+TILE = 'r203_c27'
+
+
+@pytest.fixture
+def overpass(tmp_path, monkeypatch):
+    """Overpass stub behind a fresh, enabled osmnx cache."""
+    config = StubConfig(recordings=str(tmp_path / 'recordings'), overpass_latency=0, power_latency=0)
+    server = start_stub_server(config, port=0)
+    monkeypatch.setattr(ox.settings, 'overpass_url', f'http://127.0.0.1:{server.server_address[1]}/api')
+    monkeypatch.setattr(ox.settings, 'cache_folder', str(tmp_path / 'cache'))
+    monkeypatch.setattr(ox.settings, 'use_cache', True)
+    yield config
+    server.shutdown()
+
+
+@pytest.fixture
+def fetch_drive(monkeypatch):
+    """build_tile reduced to its drive network fetch (a corner of the tile)."""
+    def build_tile(name):
+        south, west, north, east = tile_bbox(name)
+        drive = ox.graph_from_bbox((west, south, west + 0.03, south + 0.03), network_type='drive')
+        return {'seg_way': np.empty(0, np.int64),
+                'drive_ids': np.fromiter(drive.nodes, dtype=np.int64)}
+
+    monkeypatch.setattr(road_index, 'build_tile', build_tile)
+
+
+def build(index_dir, monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['build_road_index.py', '--index-dir', str(index_dir), *args])
+    build_road_index.main()
+
+
+def test_stale_rebuild_bypasses_osmnx_cache(tmp_path, monkeypatch, overpass, fetch_drive):
+    index_dir = tmp_path / 'index'
+    build(index_dir, monkeypatch, '--tiles', TILE)
+    fetched = overpass.stats['overpass']['requests']
+    assert fetched > 0
+
+    # A plain rebuild is answered from the osmnx cache
+    build(index_dir, monkeypatch, '--tiles', TILE)
+    assert overpass.stats['overpass']['requests'] == fetched
+
+    manifest = read_manifest(str(index_dir))
+    manifest['tiles'][TILE]['stale'] = True
+    write_manifest(str(index_dir), manifest)
+    build(index_dir, monkeypatch, '--stale')
+    assert overpass.stats['overpass']['requests'] > fetched
+    assert read_manifest(str(index_dir))['tiles'][TILE]['stale'] is False
+    assert ox.settings.use_cache
+
+
+def test_fresh_osm_data_restores_setting(monkeypatch):
+    monkeypatch.setattr(ox.settings, 'use_cache', True)
+    with pytest.raises(RuntimeError):
+        with road_index.fresh_osm_data():
+            assert not ox.settings.use_cache
+            raise RuntimeError
+    assert ox.settings.use_cache